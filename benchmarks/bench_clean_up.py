@@ -0,0 +1,131 @@
+"""Measure the scan and delete throughput of clean-up against a fake Artifact Registry.
+
+Each size runs a full `clean-up` (scan, then delete) of a synthetic repository
+served by `FakeArtifactRegistry`, with the configured page and long-running
+operation latencies and error rate. Results are printed as a table and can be
+written to a JSON file to be compared between runs.
+
+Usage: python benchmarks/bench_clean_up.py [--sizes 1000 100000 1000000] [--output results.json] [-- CLEAN-UP OPTIONS]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import UTC, datetime, timedelta
+
+from mozilla_linux_pkg_manager import cli
+from mozilla_linux_pkg_manager.config import rules_from_args
+
+# The fake registry lives with the tests, outside of the package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "test"))
+from fake import FakeArtifactRegistry  # noqa: E402
+
+
+async def benchmark(size, args):
+    # One version is created every day, so expire the requested fraction of them.
+    versions_per_package = size // args.packages
+    retention_days = int(versions_per_package * (1 - args.expired_fraction))
+    registry = FakeArtifactRegistry.synthetic(
+        size,
+        packages=args.packages,
+        interval=timedelta(days=1),
+        page_latency=args.page_latency,
+        lro_latency=args.lro_latency,
+        error_rate=args.error_rate,
+        filters_versions=args.filters_versions,
+    )
+    clean_up_args = cli.get_parser().parse_args(
+        [
+            "clean-up",
+            "--package",
+            ".*",
+            "--repository",
+            "mozilla",
+            "--region",
+            "us",
+            "--retention-days",
+            str(retention_days),
+            "--scan-concurrency",
+            str(args.concurrency),
+            "--delete-concurrency",
+            str(args.concurrency),
+            *args.clean_up_args,
+        ]
+    )
+    rules = rules_from_args(clean_up_args, datetime.now(UTC))
+
+    async with registry.session(
+        max_concurrent_requests=clean_up_args.max_concurrent_requests,
+        prefetch_pages=clean_up_args.prefetch_pages,
+    ) as session:
+        start = time.perf_counter()
+        inventory, _, _ = await cli.scan_repositories(clean_up_args, rules, session)
+        scanned = time.perf_counter()
+        targets = inventory.targets(inventory.expired(rules[0].cutoff))
+        await cli.batch_delete_versions(targets, clean_up_args, session=session)
+        deleted = time.perf_counter()
+
+    return {
+        "versions": size,
+        "scan_seconds": scanned - start,
+        "scan_versions_per_second": len(inventory) / (scanned - start),
+        "fetched_versions": registry.fetched_versions,
+        "deleted_versions": registry.deleted_versions,
+        "delete_seconds": deleted - scanned,
+        "delete_versions_per_second": registry.deleted_versions
+        / max(deleted - scanned, 1e-9),
+        "calls": registry.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--packages", type=int, default=100)
+    parser.add_argument("--expired-fraction", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--lro-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument(
+        "--filters-versions",
+        action="store_true",
+        help="Let the fake filter version listings by creation time, for clean-up's --server-filter",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument(
+        "clean_up_args",
+        nargs=argparse.REMAINDER,
+        help="Extra clean-up options, after --",
+    )
+    args = parser.parse_args()
+    args.clean_up_args = [arg for arg in args.clean_up_args if arg != "--"]
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "fake-project")
+
+    results = []
+    print(
+        f"{'versions':>10} {'scan s':>8} {'scan v/s':>10} {'deleted':>9} {'delete s':>9} {'delete v/s':>11}"
+    )
+    for size in args.sizes:
+        result = asyncio.run(benchmark(size, args))
+        results.append(result)
+        print(
+            f"{result['versions']:>10} {result['scan_seconds']:>8.2f} {result['scan_versions_per_second']:>10.0f} "
+            f"{result['deleted_versions']:>9} {result['delete_seconds']:>9.2f} {result['delete_versions_per_second']:>11.0f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
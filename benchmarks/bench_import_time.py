@@ -0,0 +1,73 @@
+"""Measure the startup latency of mozilla-linux-pkg-manager with `python -X importtime`.
+
+Each module is imported in a fresh interpreter several times, and the median
+cumulative import time is reported, along with the wall time of `--help`. The
+slowest imports of the full command-line module are listed, to spot new heavy
+dependencies.
+
+Usage: python benchmarks/bench_import_time.py [--runs 5] [--top 10]
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = ("mozilla_linux_pkg_manager.main", "mozilla_linux_pkg_manager.cli")
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(module):
+    """Return the `(cumulative microseconds, module)` of every import of `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return [
+        (int(match.group(2)), match.group(4))
+        for match in map(IMPORT_TIME.match, result.stderr.splitlines())
+        if match
+    ]
+
+
+def help_seconds():
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from mozilla_linux_pkg_manager.main import main; sys.argv[1:] = ['--help']; main()",
+        ],
+        capture_output=True,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    for module in MODULES:
+        totals = []
+        for _ in range(args.runs):
+            times = import_times(module)
+            totals.append(dict((name, total) for total, name in times)[module])
+        print(f"{module:>32}: {statistics.median(totals) / 1000:7.1f} ms")
+    print(
+        f"{'--help':>32}: {statistics.median(help_seconds() for _ in range(args.runs)) * 1000:7.1f} ms wall time"
+    )
+
+    print(f"Slowest imports of {MODULES[-1]}:")
+    for total, name in sorted(import_times(MODULES[-1]), reverse=True)[: args.top]:
+        print(f"{name:>48}: {total / 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
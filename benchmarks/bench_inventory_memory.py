@@ -0,0 +1,78 @@
+"""Compare the memory used to hold a scan's versions before and after VersionInventory.
+
+The "sets" layout mirrors what `clean_up` used to keep: a set of every version
+name, a set of expired version names per package and a set of unique expired
+versions, all made of full resource names.
+
+Usage: python benchmarks/bench_inventory_memory.py [--versions 1000000]
+"""
+
+import argparse
+import gc
+import tracemalloc
+from collections import defaultdict
+
+from mozilla_linux_pkg_manager.inventory import VersionInventory
+
+REPOSITORY = "projects/moz-fx-productdelivery-pr-38b5/locations/us/repositories/mozilla"
+CUTOFF = 500_000
+
+
+def synthetic_versions(count, packages):
+    """Yield `count` versions spread over `packages` l10n packages."""
+    per_package = count // packages
+    for package in range(packages):
+        package_name = f"{REPOSITORY}/packages/firefox-nightly-l10n-{package}"
+        for version in range(per_package):
+            yield package_name, f"{130 + version // 1000}.0a1~{20240101000000 + version}", version * 1_000
+
+
+def build_sets(versions):
+    all_versions = set()
+    targets = defaultdict(set)
+    unique_expired_versions = set()
+    for package_name, version, create_time in versions:
+        name = f"{package_name}/versions/{version}"
+        all_versions.add(name)
+        if create_time < CUTOFF:
+            targets[package_name].add(name)
+            unique_expired_versions.add(version)
+    return all_versions, targets, unique_expired_versions
+
+
+def build_inventory(versions):
+    inventory = VersionInventory()
+    for package_name, version, create_time in versions:
+        inventory.add(inventory.add_package(package_name), version, create_time)
+    selection = inventory.expired(CUTOFF)
+    return inventory, selection, inventory.unique_versions(selection)
+
+
+def measure(build, versions):
+    gc.collect()
+    tracemalloc.start()
+    result = build(versions)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", type=int, default=1_000_000)
+    parser.add_argument("--packages", type=int, default=100)
+    args = parser.parse_args()
+
+    results = {}
+    for label, build in (("sets", build_sets), ("inventory", build_inventory)):
+        current, peak = measure(build, synthetic_versions(args.versions, args.packages))
+        results[label] = current
+        print(
+            f"{label:>9}: {current / 2**20:8.1f} MiB retained, {peak / 2**20:8.1f} MiB peak"
+        )
+    print(f"Reduction: {results['sets'] / results['inventory']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
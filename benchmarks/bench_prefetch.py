@@ -0,0 +1,101 @@
+"""Measure how prefetching pages overlaps listing latency with processing.
+
+Each depth lists the versions of synthetic packages served by
+`FakeArtifactRegistry` with a page latency, one package at a time, spending
+`--process-seconds` on each page like a scan busy adding versions to its
+inventory or submitting them for deletion. Then it runs a streaming `clean-up`
+of the same registry, where pages are processed while versions are deleted.
+
+Usage: python benchmarks/bench_prefetch.py [--depths 0 1 2] [--page-latency 0.05] [--process-seconds 0.05]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import timedelta
+
+from mozilla_linux_pkg_manager import cli
+
+# The fake registry lives with the tests, outside of the package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "test"))
+from fake import FakeArtifactRegistry  # noqa: E402
+
+
+def registry(args):
+    return FakeArtifactRegistry.synthetic(
+        args.versions,
+        packages=args.packages,
+        interval=timedelta(hours=1),
+        page_latency=args.page_latency,
+        lro_latency=args.lro_latency,
+    )
+
+
+async def list_packages(args, depth):
+    fake = registry(args)
+    async with fake.session(prefetch_pages=depth) as session:
+        start = time.perf_counter()
+        for package in fake.packages.values():
+            versions = await cli.list_versions(package, session)
+            count = 0
+            async for _ in cli.paged(versions, "versions", session, "list_versions"):
+                count += 1
+                if count % 1000 == 0:
+                    time.sleep(args.process_seconds)
+        return time.perf_counter() - start
+
+
+async def stream_clean_up(args, depth):
+    fake = registry(args)
+    clean_up_args = cli.get_parser().parse_args(
+        [
+            "clean-up",
+            "--package",
+            ".*",
+            "--repository",
+            "mozilla",
+            "--region",
+            "us",
+            "--retention-days",
+            "1",
+            "--stream",
+            "--prefetch-pages",
+            str(depth),
+        ]
+    )
+    async with fake.session(prefetch_pages=depth) as session:
+        start = time.perf_counter()
+        await cli.scan_and_clean_up(clean_up_args, session, cache=None)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--versions", type=int, default=50_000)
+    parser.add_argument("--packages", type=int, default=5)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--process-seconds", type=float, default=0.05)
+    parser.add_argument("--lro-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "fake-project")
+
+    print(f"{'depth':>6} {'list s':>8} {'speedup':>8} {'stream s':>9} {'speedup':>8}")
+    baseline = None
+    for depth in args.depths:
+        listed = asyncio.run(list_packages(args, depth))
+        streamed = asyncio.run(stream_clean_up(args, depth))
+        baseline = baseline or (listed, streamed)
+        print(
+            f"{depth:>6} {listed:>8.2f} {baseline[0] / listed:>7.2f}x "
+            f"{streamed:>9.2f} {baseline[1] / streamed:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
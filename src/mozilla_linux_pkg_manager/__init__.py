@@ -1 +1,8 @@
-import mozilla_linux_pkg_manager.cli as cli  # noqa
+import importlib
+
+
+def __getattr__(name):
+    # Load `cli` on first use, since it imports the Google Cloud client libraries.
+    if name == "cli":
+        return importlib.import_module(f"{__name__}.cli")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
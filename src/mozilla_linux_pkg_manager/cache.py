@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import time
+from collections import defaultdict
+
+# Bumped whenever the schema changes. Caches with another version are dropped
+# and filled again rather than migrated.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT PRIMARY KEY,
+    refreshed_at INTEGER NOT NULL,
+    high_water INTEGER,
+    low_water INTEGER
+);
+CREATE TABLE IF NOT EXISTS versions (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    create_time INTEGER NOT NULL,
+    PRIMARY KEY (package, version)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS versions_by_create_time ON versions (package, create_time);
+"""
+
+
+class InventoryCache:
+    """On-disk inventory of package versions and their creation time.
+
+    Packages listed less than `ttl` seconds ago are fresh, and read from the cache
+    instead of being listed again.
+    """
+
+    def __init__(self, path, ttl, max_age):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.db = sqlite3.connect(path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.executescript(f"""
+                DROP TABLE IF EXISTS packages;
+                DROP TABLE IF EXISTS versions;
+                PRAGMA user_version = {SCHEMA_VERSION};
+                """)
+        self.db.executescript(SCHEMA)
+        # Versions removed during this run, which must not come back if a
+        # listing that started before their deletion is stored afterwards.
+        self.removed = defaultdict(set)
+
+    @classmethod
+    def from_args(cls, args, retention_days):
+        if not args.cache_dir:
+            return None
+        return cls(
+            os.path.join(args.cache_dir, "inventory.sqlite3"),
+            # Never trust the cache for longer than the shortest retention
+            # period, see above.
+            ttl=min(args.cache_ttl_hours * 3600, retention_days * 86400),
+            max_age=args.cache_max_age_days * 86400,
+        )
+
+    def close(self):
+        self.db.close()
+
+    def is_fresh(self, package, now=None):
+        now = now or time.time()
+        row = self.db.execute(
+            "SELECT refreshed_at FROM packages WHERE name = ?", (package,)
+        ).fetchone()
+        return row is not None and now - row[0] < self.ttl
+
+    def marks(self, package):
+        """Return the `(high_water, low_water)` marks of `package`, or None if it isn't cached."""
+        row = self.db.execute(
+            "SELECT high_water, low_water FROM packages WHERE name = ?", (package,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return row
+
+    def replace(self, package, versions, now=None):
+        """Replace the cached versions of `package` with `(name, create_time)` pairs."""
+        with self.db:
+            self.db.execute("DELETE FROM versions WHERE package = ?", (package,))
+            self.db.execute("DELETE FROM packages WHERE name = ?", (package,))
+            self.insert(package, versions, now)
+
+    def add(self, package, versions, now=None):
+        """Add the versions of `package` created since its last refresh.
+
+        Refreshes the package as if it had been listed in full.
+        """
+        with self.db:
+            self.insert(package, versions, now)
+
+    def insert(self, package, versions, now):
+        now = now or time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO versions VALUES (?, ?, ?)",
+            (
+                (package, os.path.basename(name), int(create_time))
+                for name, create_time in versions
+                if os.path.basename(name) not in self.removed[package]
+            ),
+        )
+        # Keep the high-water mark of versions deleted since, so they aren't
+        # listed again.
+        self.db.execute(
+            """
+            INSERT INTO packages (name, refreshed_at, high_water)
+            SELECT ?, ?, MAX(create_time) FROM versions WHERE package = ?
+            ON CONFLICT (name) DO UPDATE SET
+                refreshed_at = excluded.refreshed_at,
+                high_water = MAX(COALESCE(high_water, excluded.high_water), excluded.high_water)
+            """,
+            (package, int(now), package),
+        )
+        self.update_low_water(package)
+
+    def update_low_water(self, package):
+        self.db.execute(
+            """
+            UPDATE packages SET low_water = (
+                SELECT MIN(create_time) FROM versions WHERE package = ?
+            ) WHERE name = ?
+            """,
+            (package, package),
+        )
+
+    def versions(self, package):
+        """Return the `(name, create_time)` pairs of `package`, oldest first."""
+        return [
+            (f"{package}/versions/{version}", create_time)
+            for version, create_time in self.db.execute(
+                "SELECT version, create_time FROM versions WHERE package = ? ORDER BY create_time",
+                (package,),
+            )
+        ]
+
+    def remove(self, package, names):
+        self.removed[package].update(os.path.basename(name) for name in names)
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM versions WHERE package = ? AND version = ?",
+                ((package, os.path.basename(name)) for name in names),
+            )
+            self.update_low_water(package)
+
+    def evict(self, now=None):
+        """Drop the packages that haven't been refreshed for `max_age` seconds."""
+        now = now or time.time()
+        with self.db:
+            stale = self.db.execute(
+                "SELECT name FROM packages WHERE refreshed_at < ?",
+                (int(now - self.max_age),),
+            ).fetchall()
+            self.db.executemany("DELETE FROM versions WHERE package = ?", stale)
+            self.db.executemany("DELETE FROM packages WHERE name = ?", stale)
+        return len(stale)
@@ -1,12 +1,18 @@
 import argparse
 import asyncio
+import contextlib
+import itertools
 import json
 import logging
+import multiprocessing
 import os
 import re
 import time
+import zlib
 from collections import defaultdict
-from datetime import UTC, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
 from itertools import batched
 
 import requests
@@ -16,9 +22,28 @@ from google.api_core import retry_async
 from google.auth import exceptions as auth_exceptions
 from google.cloud import artifactregistry_v1
 
-logging.basicConfig(
-    format="%(asctime)s - %(funcName)s - %(message)s",
-    level=logging.INFO,
+from mozilla_linux_pkg_manager.cache import InventoryCache
+from mozilla_linux_pkg_manager.config import (
+    group_rules,
+    repository_regions,
+    rules_from_args,
+    split_rules_by_region,
+)
+from mozilla_linux_pkg_manager.inventory import VersionInventory
+from mozilla_linux_pkg_manager.journal import Journal
+from mozilla_linux_pkg_manager.limiter import BatchSizer
+from mozilla_linux_pkg_manager.main import get_parser, main  # noqa: F401
+from mozilla_linux_pkg_manager.metrics import SIZE_BUCKETS
+from mozilla_linux_pkg_manager.plan import read_plan, write_plan
+from mozilla_linux_pkg_manager.prefetch import prefetched
+from mozilla_linux_pkg_manager.report import ExpiryReport
+from mozilla_linux_pkg_manager.session import Session
+from mozilla_linux_pkg_manager.snapshot import SnapshotWriter
+from mozilla_linux_pkg_manager.summary import (
+    CleanUpSummary,
+    log_delete_summary,
+    log_leftovers,
+    log_scan_summary,
 )
 
 RETRYABLE_TYPES = (
@@ -51,182 +76,1145 @@ def should_retry(exc):
 
 ASYNC_RETRY = retry_async.AsyncRetry(predicate=should_retry)
 
+# Number of versions deleted by each BatchDeleteVersionsRequest, unless the
+# batch size of the repository was adjusted, see `BatchSizer`.
+BATCH_SIZE = 50
 
-async def batch_delete_versions(targets, args):
-    client = artifactregistry_v1.ArtifactRegistryAsyncClient()
-    start = time.time()
-    for package in targets:
-        batches = batched(targets[package], 50)
-        for batch in batches:
-            logging.info(
-                f"{'Would delete' if args.dry_run else 'Deleting'} {format(len(batch), ',')} expired package versions of {os.path.basename(package)}..."
-            )
-            request = artifactregistry_v1.BatchDeleteVersionsRequest(
-                parent=package,
-                names=batch,
-                validate_only=args.dry_run,
+# Number of items of each page of a listing.
+PAGE_SIZE = 1000
+
+# Duration assumed of a batch delete operation until one actually completed,
+# see `DeleteScheduler.out_of_time`.
+BATCH_SECONDS = 10
+
+# Full resource name of a package.
+PACKAGE_NAME = re.compile(
+    r"projects/[^/]+/locations/[^/]+/repositories/[^/]+/packages/[^/]+"
+)
+
+# Failures of a batch caused by some of its versions, like one that was already
+# deleted. The batch is split in halves that are retried on their own, until
+# the failing versions are isolated. Versions isolated by a `NotFound` are gone
+# either way, and count as deleted.
+BISECT_TYPES = (
+    api_exceptions.NotFound,  # 404
+    api_exceptions.InvalidArgument,  # 400
+    api_exceptions.FailedPrecondition,  # 400
+)
+
+# The only fields of listed versions clean-up reads. The field mask system
+# parameter makes the server leave the others out of the response. It's only
+# sent along with a filter, so the fallback for a server refusing the filter
+# covers one refusing the mask too.
+VERSIONS_FIELD_MASK = (
+    ("x-goog-fieldmask", "versions.name,versions.createTime,nextPageToken"),
+)
+
+
+class RateLimiter:
+    """Space out calls so that at most `rate` of them start every second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = 0
+
+    async def wait(self):
+        now = time.monotonic()
+        delay = self.next_slot - now
+        self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class DeleteScheduler:
+    """Delete batches of versions, with up to `args.delete_concurrency` in flight."""
+
+    def __init__(self, session, args, on_deleted=(), journal=None, deadline=None):
+        self.session = session
+        self.args = args
+        self.on_deleted = on_deleted
+        # Dry runs don't record anything a resumed run would then delete.
+        self.journal = None if args.dry_run else journal
+        self.queue = asyncio.Queue(maxsize=args.delete_concurrency)
+        self.limiters = defaultdict(lambda: RateLimiter(args.max_requests_per_second))
+        self.sizers = defaultdict(
+            lambda: BatchSizer(BATCH_SIZE, args.max_batch_size or BATCH_SIZE)
+        )
+        self.deleted_versions = 0
+        self.succeeded_batches = 0
+        self.failed_batches = []
+        self.sampled_packages = set()
+        self.deadline = deadline
+        self.slowest_batch = 0
+        self.leftover_versions = 0
+        self.leftover_packages = set()
+
+    async def __aenter__(self):
+        self.start = time.time()
+        self.group = asyncio.TaskGroup()
+        await self.group.__aenter__()
+        for _ in range(self.args.delete_concurrency):
+            self.group.create_task(self.worker())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            for _ in range(self.args.delete_concurrency):
+                await self.queue.put(None)
+        result = await self.group.__aexit__(exc_type, exc, tb)
+        self.end = time.time()
+        self.session.metrics.observe(
+            "phase_seconds", self.end - self.start, phase="delete"
+        )
+        return result
+
+    async def submit(self, package, names, batch_id=None):
+        """Queue a batch, recording it in the journal unless it's already there."""
+        if self.journal and batch_id is None:
+            batch_id = self.journal.plan(package, names)
+        await self.queue.put((package, names, batch_id))
+
+    def batch_size(self, package):
+        """Return the number of versions the next batch of `package` should have."""
+        return self.sizers[package.split("/packages/")[0]].size
+
+    def out_of_time(self):
+        """Whether a batch started now might not finish before the deadline.
+
+        Keeps a margin of twice the slowest batch so far, or of `BATCH_SECONDS`
+        before any batch completed, so that the batches in flight have time to
+        finish.
+        """
+        if self.deadline is None:
+            return False
+        slowest_batch = self.slowest_batch or BATCH_SECONDS
+        return time.time() + 2 * slowest_batch >= self.deadline
+
+    def leave(self, package, names):
+        """Record a batch that won't be deleted by this run."""
+        self.leftover_versions += len(names)
+        self.leftover_packages.add(package)
+
+    async def worker(self):
+        while batch := await self.queue.get():
+            package, names, batch_id = batch
+            if self.out_of_time():
+                self.leave(package, names)
+            else:
+                await self.delete(package, names, batch_id)
+
+    def sample(self, package):
+        """Whether a batch of a dry run should be validated by the API."""
+        if package in self.sampled_packages:
+            return False
+        if len(self.sampled_packages) >= self.args.validate_sample:
+            return False
+        self.sampled_packages.add(package)
+        return True
+
+    def validate(self, package, names):
+        """Check a batch of a dry run locally."""
+        error = batch_error(package, names, self.args.max_batch_size or BATCH_SIZE)
+        outcome = "failed" if error else "succeeded"
+        self.session.metrics.increment(
+            "batches_total",
+            outcome=outcome,
+            repository=repository_label(package),
+        )
+        if error:
+            self.failed_batches.append((package, names, ValueError(error)))
+        else:
+            self.succeeded_batches += 1
+            self.deleted_versions += len(names)
+
+    async def delete(self, package, names, batch_id):
+        if self.args.dry_run and not self.sample(package):
+            self.validate(package, names)
+            return
+        logging.info(
+            f"{'Would delete' if self.args.dry_run else 'Deleting'} {format(len(names), ',')} expired package versions of {os.path.basename(package)}..."
+        )
+        repository = package.split("/packages/")[0]
+        await self.limiters[repository].wait()
+        request = artifactregistry_v1.BatchDeleteVersionsRequest(
+            parent=package,
+            names=names,
+            validate_only=self.args.dry_run,
+        )
+        metrics = self.session.metrics
+        repository_name = os.path.basename(repository)
+        sizer = self.sizers[repository]
+        metrics.observe(
+            "batch_size", len(names), buckets=SIZE_BUCKETS, repository=repository_name
+        )
+        start = time.monotonic()
+        try:
+            async with get_limiter(self.session):
+                with metrics.timer(
+                    "rpc_seconds",
+                    method="batch_delete_versions",
+                    repository=repository_name,
+                ):
+                    operation = await self.session.client().batch_delete_versions(
+                        request=request,
+                        retry=get_retry(self.session, "batch_delete_versions"),
+                    )
+                with metrics.timer("lro_wait_seconds", repository=repository_name):
+                    await operation.result()
+        except (api_exceptions.GoogleAPICallError, api_exceptions.RetryError) as e:
+            self.slowest_batch = max(self.slowest_batch, time.monotonic() - start)
+            sizer.on_error(len(names), e)
+            if isinstance(e, api_exceptions.NotFound) and len(names) == 1:
+                # Like a version of a batch whose operation finished after its
+                # run was stopped, so it was never recorded as done.
+                self.deleted(package, names, batch_id)
+                return
+            if isinstance(e, BISECT_TYPES) and len(names) > 1:
+                metrics.increment(
+                    "batches_total", outcome="split", repository=repository_name
+                )
+                await self.bisect(package, names, batch_id, e)
+                return
+            metrics.increment(
+                "batches_total", outcome="failed", repository=repository_name
             )
-            operation = await client.batch_delete_versions(
-                request=request, retry=ASYNC_RETRY
+            self.failed_batches.append((package, names, e))
+        else:
+            elapsed = time.monotonic() - start
+            self.slowest_batch = max(self.slowest_batch, elapsed)
+            sizer.on_success(len(names), elapsed)
+            self.deleted(package, names, batch_id)
+
+    def deleted(self, package, names, batch_id):
+        """Record a batch whose versions are gone."""
+        self.session.metrics.increment(
+            "batches_total", outcome="succeeded", repository=repository_label(package)
+        )
+        self.succeeded_batches += 1
+        self.deleted_versions += len(names)
+        if not self.args.dry_run:
+            for callback in self.on_deleted:
+                callback(package, names)
+            if self.journal:
+                self.journal.done(batch_id)
+
+    async def bisect(self, package, names, batch_id, error):
+        """Split a batch that failed with one of `BISECT_TYPES` in halves."""
+        logging.warning(
+            f"Splitting a failed batch of {len(names)} versions of {os.path.basename(package)} ({error})"
+        )
+        half = len(names) // 2
+        halves = (names[:half], names[half:])
+        half_ids = (None, None)
+        if self.journal:
+            # Record the halves before retiring the batch, so that a resumed
+            # run retries whichever of them never succeeded.
+            half_ids = [
+                self.journal.plan(package, half_names, sync=False)
+                for half_names in halves
+            ]
+            self.journal.done(batch_id)
+        for half_names, half_id in zip(halves, half_ids):
+            await self.delete(package, half_names, half_id)
+
+    def log_summary(self):
+        for repository, sizer in sorted(self.sizers.items()):
+            if sizer.changes:
+                logging.info(
+                    f"Batches of {os.path.basename(repository)} ended at {sizer.size} versions, "
+                    f"after {sizer.changes} size changes and up to {sizer.largest} versions."
+                )
+        log_delete_summary(
+            self.end - self.start,
+            self.succeeded_batches,
+            self.failed_batches,
+            self.deleted_versions,
+            self.args.dry_run,
+        )
+        if self.leftover_versions:
+            log_leftovers(self.leftover_versions, len(self.leftover_packages))
+
+
+def get_client(session):
+    """Return a client of the run's session, or a standalone one without a session."""
+    if session is None:
+        return artifactregistry_v1.ArtifactRegistryAsyncClient()
+    return session.client()
+
+
+def get_limiter(session):
+    """Return the adaptive limiter API calls of the run's session go through, if any."""
+    if session is None or session.limiter is None:
+        return contextlib.nullcontext()
+    return session.limiter
+
+
+def get_retry(session, method):
+    """Return a retry policy reporting failed attempts to the session's metrics and limiter."""
+    if session is None:
+        return ASYNC_RETRY
+
+    def on_error(exc):
+        session.metrics.increment(
+            "retries_total", method=method, exception=type(exc).__name__
+        )
+        if session.limiter:
+            session.limiter.on_error(exc)
+
+    return retry_async.AsyncRetry(predicate=should_retry, on_error=on_error)
+
+
+@contextlib.asynccontextmanager
+async def api_call(session, method, name):
+    """Go through the session's limiter, timing the call of `method` on the `name` resource."""
+    async with get_limiter(session):
+        if session is None:
+            yield
+            return
+        with session.metrics.timer(
+            "rpc_seconds", method=method, repository=repository_label(name)
+        ):
+            yield
+
+
+def repository_label(name):
+    """Return the repository of a resource name, for metrics."""
+    return name.partition("/repositories/")[2].partition("/")[0]
+
+
+async def paged(pager, field, session, method, prefetch_pages=None):
+    """Iterate over the items of a pager, counting and timing its pages.
+
+    The next `prefetch_pages` pages (defaulting to `session.prefetch_pages`)
+    are fetched in the background while the items of the current one are
+    processed. Pagers without pages (like mocks) are iterated over directly.
+    """
+    if session is None or not hasattr(type(pager), "pages"):
+        async for item in pager:
+            yield item
+        return
+    if prefetch_pages is None:
+        prefetch_pages = session.prefetch_pages
+    async for page in prefetched(timed_pages(pager, session, method), prefetch_pages):
+        for item in getattr(page, field):
+            yield item
+
+
+async def timed_pages(pager, session, method):
+    """Iterate over the pages of a pager, counting and timing them.
+
+    Fetching the next pages goes through the session's limiter, like any other
+    API call.
+    """
+    pages = aiter(pager.pages)
+    first = True
+    while True:
+        start = time.perf_counter()
+        try:
+            # The first page comes with the list call, which went through the
+            # limiter and is timed on its own.
+            async with contextlib.nullcontext() if first else get_limiter(session):
+                page = await anext(pages)
+        except StopAsyncIteration:
+            return
+        if not first:
+            session.metrics.observe(
+                "page_seconds", time.perf_counter() - start, method=method
             )
-            await operation.result()
-    end = time.time()
-    elapsed = int(end - start)
-    logging.info(
-        f"Done. Ran delete version requests for {elapsed} seconds (that's about ~{elapsed // 60} minutes.)"
-    )
+        first = False
+        session.metrics.increment("pages_total", method=method)
+        yield page
+
+
+def batch_error(package, names, max_batch_size):
+    """Return why a batch delete request would be rejected, or None if it's valid."""
+    if not PACKAGE_NAME.fullmatch(package):
+        return f"{package} isn't the name of a package"
+    if not 0 < len(names) <= max_batch_size:
+        return f"Batch of {len(names)} versions, expected 1 to {max_batch_size}"
+    prefix = f"{package}/versions/"
+    for name in names:
+        version = name.removeprefix(prefix)
+        if version == name or not version or "/" in version:
+            return f"{name} isn't the name of a version of {package}"
+    if len(set(names)) < len(names):
+        return "Batch with duplicate versions"
+    return None
+
+
+def fixed_batch_size(package):
+    return BATCH_SIZE
+
+
+def batches(targets, batch_size=fixed_batch_size):
+    """Split the versions of each package of `targets` into batches.
+
+    `batch_size` is a callable returning the size of the next batch of a
+    package, so batches can be sized as they're taken.
+    """
+    for package, names in targets.items():
+        names = iter(names)
+        while batch := tuple(itertools.islice(names, batch_size(package))):
+            yield package, batch
+
+
+async def batch_delete_versions(
+    targets,
+    args,
+    session=None,
+    on_deleted=(),
+    journal=None,
+    summary=None,
+    batch_source=batches,
+    deadline=None,
+):
+    """Delete the versions of each package of `targets` in batches."""
+    batch_ids = itertools.repeat(None)
+    adaptive = True
+    if journal and not args.dry_run:
+        # Record the whole plan before deleting anything, so that a resumed
+        # run knows about the batches this one never got to.
+        batch_ids = itertools.count(journal.next_id)
+        # The batches are fixed by then, so they can't be resized.
+        adaptive = False
+        for package, batch in batch_source(targets, fixed_batch_size):
+            journal.plan(package, batch, sync=False)
+        journal.sync()
+
+    async with DeleteScheduler(
+        session or Session(), args, on_deleted, journal, deadline
+    ) as scheduler:
+        # Batches are only taken once the scheduler has room for them, so
+        # their size follows the outcome of the latest ones.
+        targets_batches = batch_source(
+            targets, scheduler.batch_size if adaptive else fixed_batch_size
+        )
+        for (package, batch), batch_id in zip(targets_batches, batch_ids):
+            if scheduler.out_of_time():
+                scheduler.leave(package, batch)
+            else:
+                await scheduler.submit(package, batch, batch_id)
+    scheduler.log_summary()
+    if summary is not None:
+        summary.add_deletions(scheduler)
+    elif scheduler.failed_batches:
+        exit(1)
 
 
-async def get_repository(region, repository_name):
-    client = artifactregistry_v1.ArtifactRegistryAsyncClient()
+async def get_repository(region, repository_name, session=None):
+    client = get_client(session)
     parent = f"projects/{os.environ['GOOGLE_CLOUD_PROJECT']}/locations/{region}/repositories/{repository_name}"
     get_repository_request = artifactregistry_v1.GetRepositoryRequest(
         name=parent,
     )
-    repository = await client.get_repository(
-        request=get_repository_request, retry=ASYNC_RETRY
-    )
+    async with api_call(session, "get_repository", parent):
+        repository = await client.get_repository(
+            request=get_repository_request, retry=get_retry(session, "get_repository")
+        )
     return repository
 
 
-async def list_packages(repository):
-    client = artifactregistry_v1.ArtifactRegistryAsyncClient()
+async def list_packages(repository, session=None):
+    client = get_client(session)
     request = artifactregistry_v1.ListPackagesRequest(
         parent=repository.name,
-        page_size=1000,
+        page_size=PAGE_SIZE,
     )
-    packages = await client.list_packages(request=request, retry=ASYNC_RETRY)
+    async with api_call(session, "list_packages", repository.name):
+        packages = await client.list_packages(
+            request=request, retry=get_retry(session, "list_packages")
+        )
     return packages
 
 
-async def list_versions(package):
-    client = artifactregistry_v1.ArtifactRegistryAsyncClient()
+async def list_versions(package, session=None, created_before=None, newest_first=False):
+    """List the versions of a package, only those created before `created_before`.
+
+    With `created_before`, only the name and creation time of versions are
+    requested, see `VERSIONS_FIELD_MASK`. Raises InvalidArgument when the server
+    can't filter or order versions by creation time.
+    """
+    client = get_client(session)
     request = artifactregistry_v1.ListVersionsRequest(
         parent=package.name,
-        page_size=1000,
+        page_size=PAGE_SIZE,
+        view=artifactregistry_v1.VersionView.BASIC,
     )
-    versions = await client.list_versions(request=request, retry=ASYNC_RETRY)
+    metadata = ()
+    if created_before is not None:
+        timestamp = datetime.fromtimestamp(created_before, UTC).isoformat()
+        request.filter = f'create_time < "{timestamp.removesuffix("+00:00")}Z"'
+        metadata = VERSIONS_FIELD_MASK
+    if newest_first:
+        request.order_by = "create_time desc"
+    async with api_call(session, "list_versions", package.name):
+        versions = await client.list_versions(
+            request=request,
+            retry=get_retry(session, "list_versions"),
+            metadata=metadata,
+        )
     return versions
 
 
-async def clean_up(args):
-    now = datetime.now(UTC)
-    targets = defaultdict(set)
-    pattern = re.compile(args.package)
-    unique_expired_versions = set()
-    all_versions = set()
+@dataclass
+class PackageScan:
+    """What a scan found in a single package.
 
-    start = time.time()
+    Expired versions are only tracked here when they're streamed to a
+    scheduler, otherwise they're selected from the inventory after the scan.
+    """
+
+    version_count: int = 0
+    expired_count: int = 0
+    expired_versions: list = field(default_factory=list)
+    unique_expired_versions: set = field(default_factory=set)
+    elapsed: float = 0
+
+
+async def get_version(name, session=None):
+    client = get_client(session)
+    request = artifactregistry_v1.GetVersionRequest(
+        name=name,
+        view=artifactregistry_v1.VersionView.BASIC,
+    )
+    async with api_call(session, "get_version", name):
+        version = await client.get_version(
+            request=request, retry=get_retry(session, "get_version")
+        )
+    return version
+
+
+async def version_exists(name, session):
+    try:
+        await get_version(name, session=session)
+    except api_exceptions.NotFound:
+        return False
+    return True
+
+
+async def listed_versions(package, session, cache, created_before=None):
+    """Yield the name and creation time of every version of a package from the API.
+
+    With `created_before`, the server is asked to only list the versions created
+    before then. If it can't, every version is listed and it's up to the caller
+    to filter them, like it does without `created_before`.
+    """
+    inventory = []
+    if created_before is not None and session.filters_versions:
+        try:
+            versions = await list_versions(
+                package, session=session, created_before=created_before
+            )
+        except api_exceptions.InvalidArgument as e:
+            if session.filters_versions:
+                logging.warning(
+                    f"Artifact Registry can't filter versions by creation time, filtering them client-side instead ({e})"
+                )
+            session.filters_versions = False
+            versions = await list_versions(package, session=session)
+    else:
+        versions = await list_versions(package, session=session)
+    async for version in paged(versions, "versions", session, "list_versions"):
+        create_time = version.create_time.timestamp()
+        if cache:
+            inventory.append((version.name, create_time))
+        yield version.name, create_time
+    if cache:
+        cache.replace(package.name, inventory)
+
+
+async def incremental_versions(package, cutoff, session, cache):
+    """Yield the versions of a cached package, only listing the ones it's missing.
+
+    Versions are listed newest first until reaching the package's high-water
+    mark, and the new ones are added to the cache. Falls back to listing every
+    version when the server can't order them.
+    """
+    high_water, _ = cache.marks(package.name)
+    new_versions = []
+    ordered = session.orders_versions
+    try:
+        versions = await list_versions(package, session=session, newest_first=ordered)
+    except api_exceptions.InvalidArgument as e:
+        logging.warning(
+            f"Artifact Registry can't list versions newest first, listing every version instead ({e})"
+        )
+        session.orders_versions = ordered = False
+        versions = await list_versions(package, session=session)
+    previous = float("inf")
+    # An ordered listing usually stops within its first page, so don't fetch
+    # the next ones ahead.
+    async for version in paged(
+        versions, "versions", session, "list_versions", 0 if ordered else None
+    ):
+        create_time = version.create_time.timestamp()
+        # Don't trust the order of the listing if it doesn't start at the
+        # newest versions (like when the server ignored it), or if any version
+        # is out of it. Every version is listed then.
+        if previous == float("inf"):
+            ordered = ordered and create_time >= high_water
+        ordered = ordered and create_time <= previous
+        if ordered and create_time < high_water:
+            break
+        previous = create_time
+        new_versions.append((version.name, create_time))
 
-    for repository_name in args.repository:
-        logging.info(f"Pinging repository '{repository_name}'...")
-        repository = await get_repository(args.region, repository_name)
+    if ordered:
         logging.info(
-            f"Found repository:\nrepository = {json.dumps(artifactregistry_v1.Repository.to_dict(repository), indent=4)}"
+            f"Listed {len(new_versions)} new versions of {os.path.basename(package.name)}."
         )
-        packages = await list_packages(repository)
+        cache.add(package.name, new_versions)
+    else:
+        cache.replace(package.name, new_versions)
+    async for name, create_time in cached_versions(package, cutoff, session, cache):
+        yield name, create_time
+
+
+async def cached_versions(package, cutoff, session, cache):
+    """Yield the name and creation time of every version of a package from the cache.
+
+    Expired versions are checked against the API first, and the ones that
+    don't exist anymore are dropped from the cache.
+    """
+    _, low_water = cache.marks(package.name) or (None, None)
+    versions = cache.versions(package.name)
+    if low_water is None or low_water >= cutoff:
+        # Nothing has expired since the cache was refreshed.
+        for name, create_time in versions:
+            yield name, create_time
+        return
+    if sum(create_time < cutoff for _, create_time in versions) > PAGE_SIZE:
+        # Listing the package again takes fewer calls than checking each expired
+        # version, like after runs that didn't delete the versions they found.
+        async for name, create_time in listed_versions(package, session, cache):
+            yield name, create_time
+        return
+    for batch in batched(versions, BATCH_SIZE):
+        candidates = [name for name, create_time in batch if create_time < cutoff]
+        found = await asyncio.gather(
+            *(version_exists(name, session) for name in candidates)
+        )
+        gone = {name for name, exists in zip(candidates, found) if not exists}
+        if gone:
+            cache.remove(package.name, gone)
+        for name, create_time in batch:
+            if name not in gone:
+                yield name, create_time
+
+
+async def scan_package(
+    package,
+    cutoff,
+    semaphore,
+    session,
+    inventory,
+    scheduler=None,
+    cache=None,
+    policy=None,
+    server_filter=False,
+    report=None,
+):
+    """List every version of a package into the inventory.
+
+    With a `scheduler`, expired versions are submitted for deletion as soon as a
+    full batch of them is found, unless a retention `policy` needs the whole
+    package first.
+    """
+    async with semaphore:
+        logging.info(
+            f"Looking for expired package versions of {os.path.basename(package.name)}..."
+        )
+        start = time.time()
+        scan = PackageScan()
+        if cache and cache.is_fresh(package.name):
+            versions = cached_versions(package, cutoff, session, cache)
+        elif cache and cache.marks(package.name):
+            versions = incremental_versions(package, cutoff, session, cache)
+        else:
+            versions = listed_versions(
+                package, session, cache, cutoff if server_filter else None
+            )
+        package_id = inventory.add_package(package.name)
+
+        async def expire(name, create_time):
+            if report:
+                report.add(package.name, os.path.basename(name), create_time)
+            scan.expired_count += 1
+            scan.expired_versions.append(name)
+            scan.unique_expired_versions.add(os.path.basename(name))
+            if len(scan.expired_versions) >= scheduler.batch_size(package.name):
+                await scheduler.submit(package.name, tuple(scan.expired_versions))
+                scan.expired_versions = []
+
+        held = []
+        async for name, create_time in versions:
+            scan.version_count += 1
+            if not scheduler:
+                inventory.add(package_id, os.path.basename(name), create_time)
+            elif policy:
+                held.append((name, create_time))
+            elif create_time < cutoff:
+                await expire(name, create_time)
+        if held:
+            protected = policy.protected([os.path.basename(name) for name, _ in held])
+            for index, (name, create_time) in enumerate(held):
+                if create_time < cutoff and index not in protected:
+                    await expire(name, create_time)
+        if scheduler and scan.expired_versions:
+            await scheduler.submit(package.name, tuple(scan.expired_versions))
+            scan.expired_versions = []
+        scan.elapsed = time.time() - start
+        session.metrics.add_package(
+            package.name, scan_seconds=scan.elapsed, versions=scan.version_count
+        )
+        return scan
+
+
+def in_shard(package_name, args):
+    """Whether a package belongs to the shard of this run, by a stable hash of its name."""
+    return zlib.crc32(package_name.encode()) % args.shard_count == args.shard_index
+
+
+async def scan_repository(
+    region,
+    repository_name,
+    matcher,
+    semaphore,
+    session,
+    args,
+    inventory,
+    scheduler,
+    cache,
+    report,
+):
+    """Scan the packages of a repository matching a rule, one task per package."""
+    logging.info(f"Pinging repository '{repository_name}'...")
+    repository = await get_repository(region, repository_name, session=session)
+    logging.info(f"Found repository {repository.name}.")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(
+            f"repository = {json.dumps(artifactregistry_v1.Repository.to_dict(repository), indent=4)}"
+        )
+    packages = await list_packages(repository, session=session)
+    scans = []
+    async with asyncio.TaskGroup() as group:
+        async for package in paged(packages, "packages", session, "list_packages"):
+            rule = matcher.match(os.path.basename(package.name))
+            if rule and in_shard(package.name, args):
+                rule.packages.append(package.name)
+                scans.append(
+                    group.create_task(
+                        scan_package(
+                            package,
+                            rule.cutoff,
+                            semaphore,
+                            session,
+                            inventory,
+                            scheduler,
+                            cache,
+                            rule.policy,
+                            # Policies and the cache need every version.
+                            args.server_filter and not rule.policy and not cache,
+                            report,
+                        )
+                    )
+                )
+    return [scan.result() for scan in scans]
+
 
-        async for package in packages:
-            name = os.path.basename(package.name)
-            if pattern.match(name):
-                logging.info(f"Looking for expired package versions of {name}...")
-                versions = await list_versions(package)
-                async for version in versions:
-                    all_versions.add(version.name)
-                    if now - version.create_time > timedelta(days=args.retention_days):
-                        targets[package.name].add(version.name)
-                        unique_expired_versions.add(os.path.basename(version.name))
+async def scan_repositories(
+    args, rules, session, scheduler=None, cache=None, report=None
+):
+    """Scan every repository of the `rules` concurrently.
+
+    Each repository's packages are listed once and matched against all of its
+    rules. Returns the inventory of the versions found, which is left empty
+    when expired versions were streamed to a `scheduler` (and the `report`),
+    along with the totals of the scan.
+    """
+    semaphore = asyncio.Semaphore(args.scan_concurrency)
+    inventory = VersionInventory()
+    total = PackageScan()
+    expired_packages = 0
+
+    start = time.time()
+
+    # A failing repository cancels the others, like a failing package does.
+    async with asyncio.TaskGroup() as group:
+        results = [
+            group.create_task(
+                scan_repository(
+                    region,
+                    repository_name,
+                    matcher,
+                    semaphore,
+                    session,
+                    args,
+                    inventory,
+                    scheduler,
+                    cache,
+                    report,
+                )
+            )
+            for (region, repository_name), matcher in group_rules(rules).items()
+        ]
+    for repository_results in results:
+        for scan in repository_results.result():
+            total.version_count += scan.version_count
+            total.expired_count += scan.expired_count
+            total.unique_expired_versions.update(scan.unique_expired_versions)
+            total.elapsed += scan.elapsed
+            if scan.expired_count:
+                expired_packages += 1
 
     end = time.time()
+    session.metrics.observe("phase_seconds", end - start, phase="scan")
     elapsed = int(end - start)
     logging.info(
         f"Done. Looked for {elapsed} seconds (that's about ~{elapsed // 60} minutes.)"
     )
+    logging.info(
+        f"Scanning packages one at a time would have taken about {int(total.elapsed)} seconds, "
+        f"the scan ran {total.elapsed / max(end - start, 1e-9):.1f}x faster than that "
+        f"with a concurrency of {args.scan_concurrency}."
+    )
+    return inventory, expired_packages, total
 
-    if not targets:
-        logging.info("No expired package versions found, nothing to do!")
-        exit(0)
 
-    logging.info(f"Found {len(targets)} packages matching {args.package}")
-    total_expired_versions = sum(len(target) for target in targets.values())
-    logging.info(
-        f"Found unique expired versions:\nunique_expired_versions = {json.dumps(list(unique_expired_versions), indent=4)}"
+def describe_rules(args):
+    if args.config:
+        return f"the rules of {args.config}"
+    return args.package
+
+
+async def stream_clean_up(args, rules, session, cache, journal, report):
+    """Delete expired versions while the scan is still looking for more."""
+    if args.dry_run:
+        logging.info("The dry-run mode is enabled. Doing a no-op run!")
+
+    on_deleted = [cache.remove] if cache else []
+    async with DeleteScheduler(session, args, on_deleted, journal) as scheduler:
+        _, expired_packages, total = await scan_repositories(
+            args, rules, session, scheduler, cache, report
+        )
+
+    summary = CleanUpSummary(
+        package=describe_rules(args),
+        dry_run=args.dry_run,
+        server_filtered=args.server_filter and session.filters_versions,
+        version_count=total.version_count,
+        expired_packages=expired_packages,
+        expired_count=total.expired_count,
+        unique_expired_versions=sorted(total.unique_expired_versions),
     )
-    logging.info(
-        f"There's a total of {total_expired_versions} expired versions to clean-up!"
+    if not expired_packages:
+        logging.info("No expired package versions found, nothing to do!")
+        return summary
+
+    log_scan_summary(
+        expired_packages,
+        total.expired_count,
+        summary.unique_expired_versions,
+        total.version_count,
+        summary.package,
+        summary.server_filtered,
     )
-    logging.info(
-        f"Out of those expired versions, there are {len(unique_expired_versions)} unique versions across all packages."
+    report.log()
+    scheduler.log_summary()
+    summary.add_deletions(scheduler)
+    return summary
+
+
+async def delete_batches(args, session, batches, journal=None):
+    """Delete `(batch_id, package, names)` batches that were decided by another run."""
+    if args.dry_run:
+        logging.info("The dry-run mode is enabled. Doing a no-op run!")
+
+    async with DeleteScheduler(session, args, journal=journal) as scheduler:
+        for batch_id, package, names in batches:
+            await scheduler.submit(package, names, batch_id)
+
+    scheduler.log_summary()
+    summary = CleanUpSummary(dry_run=args.dry_run)
+    summary.add_deletions(scheduler)
+    return summary
+
+
+async def resume_clean_up(args, session, journal):
+    """Run the batches of an interrupted run's journal that never succeeded."""
+    logging.info(f"Resuming the unfinished batches of {journal.path}...")
+    return await delete_batches(args, session, journal.pending(), journal)
+
+
+async def scan_and_clean_up(
+    args, session, cache, journal=None, report=None, rules=None
+):
+    deadline = time.time() + args.max_runtime if args.max_runtime else None
+    rules = rules or rules_from_args(args, datetime.now(UTC))
+    report = report or ExpiryReport()
+
+    if args.stream and not args.skip_delete and not args.plan_out:
+        return await stream_clean_up(args, rules, session, cache, journal, report)
+
+    inventory, _, _ = await scan_repositories(args, rules, session, cache=cache)
+    selection = {}
+    for rule in rules:
+        package_ids = [inventory.package_ids[name] for name in rule.packages]
+        rule_selection = inventory.expired(rule.cutoff, package_ids)
+        if rule.policy:
+            rule_selection = rule.policy.select(inventory, rule_selection)
+        selection.update(rule_selection)
+    summary = CleanUpSummary(
+        package=describe_rules(args),
+        dry_run=args.dry_run,
+        server_filtered=args.server_filter and session.filters_versions,
+        version_count=len(inventory),
     )
-    logging.info(
-        f"There's a total of {len(all_versions)} versions. After clean-up, there will be {len(all_versions) - total_expired_versions} versions left."
+
+    if not selection:
+        logging.info("No expired package versions found, nothing to do!")
+        return summary
+
+    targets = inventory.targets(selection)
+    summary.expired_packages = len(targets)
+    summary.expired_count = sum(len(rows) for rows in selection.values())
+    summary.unique_expired_versions = inventory.unique_versions(selection)
+    log_scan_summary(
+        summary.expired_packages,
+        summary.expired_count,
+        summary.unique_expired_versions,
+        summary.version_count,
+        summary.package,
+        summary.server_filtered,
     )
+    report.add_selection(inventory, selection)
+    report.log()
+
+    if args.plan_out:
+        batch_count = write_plan(args.plan_out, targets, BATCH_SIZE)
+        logging.info(
+            f"Wrote a plan of {batch_count} batch delete requests to {args.plan_out}."
+        )
+        return summary
 
     if args.skip_delete:
         logging.info(
             'The skip-delete flag is enabled. Skipping the "delete versions" step!'
         )
-        exit(0)
+        return summary
 
     if args.dry_run:
         logging.info("The dry-run mode is enabled. Doing a no-op run!")
 
-    await batch_delete_versions(targets, args)
+    on_deleted = [cache.remove] if cache else []
+    if deadline:
+        # Delete the most overdue versions first, in case time runs out.
+        await batch_delete_versions(
+            selection,
+            args,
+            session=session,
+            on_deleted=on_deleted,
+            journal=journal,
+            summary=summary,
+            batch_source=inventory.batches_by_age,
+            deadline=deadline,
+        )
+        return summary
+    await batch_delete_versions(
+        targets,
+        args,
+        session=session,
+        on_deleted=on_deleted,
+        journal=journal,
+        summary=summary,
+    )
+    return summary
 
 
-def main():
-    parser = argparse.ArgumentParser(description="mozilla-linux-pkg-manager")
-    subparsers = parser.add_subparsers(
-        dest="command",
-        required=True,
-        help='Sub-commands (currently only "clean-up" is supported)',
-    )
+async def clean_up_regions(args, session, rules, cache, journal, report):
+    """Scan and clean up the repositories of each region of the `rules` concurrently.
 
-    # Subparser for the 'clean-up' command
-    clean_up_parser = subparsers.add_parser(
-        "clean-up", help="Clean up package versions."
-    )
-    clean_up_parser.add_argument(
-        "--package",
-        type=str,
-        help='A regex that matches the name of the packages to clean-up (ex. "firefox-nightly-.*")',
-        required=True,
-    )
-    clean_up_parser.add_argument(
-        "--repository",
-        type=str,
-        nargs="+",
-        help="One or more repository names to clean up",
-        required=True,
-    )
-    clean_up_parser.add_argument(
-        "--region",
-        type=str,
-        help="",
-        required=True,
-    )
-    clean_up_parser.add_argument(
-        "--retention-days",
-        type=int,
-        required=True,
-        help="Retention period in days for the selected packages",
-    )
-    clean_up_parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Do a no-op run and print out a summary of the operations that will be executed",
-        default=False,
-    )
-    clean_up_parser.add_argument(
-        "--skip-delete",
-        action="store_true",
-        help='Skip the "delete versions" step (for testing)',
-        default=False,
+    Each region runs on a fork of the `session`, with its own connections and
+    concurrency limit, and its own scan and delete concurrency and rate limits.
+    Returns the totals of every region.
+    """
+    regions = split_rules_by_region(rules)
+
+    async def clean_up_region(region_rules):
+        async with session.fork() as region_session:
+            return await scan_and_clean_up(
+                args, region_session, cache, journal, report.fork(), region_rules
+            )
+
+    # A failing region cancels the others, rather than leaving them to run on
+    # while the journal, cache and report they share are closed.
+    async with asyncio.TaskGroup() as group:
+        summaries = [
+            group.create_task(clean_up_region(region_rules))
+            for region_rules in regions.values()
+        ]
+    summary = CleanUpSummary.merge(summary.result() for summary in summaries)
+    logging.info(f"Totals of the {len(regions)} regions:")
+    summary.log()
+    return summary
+
+
+@contextlib.asynccontextmanager
+async def run_session(args):
+    """Open the session of a run, writing its metrics once the run is over."""
+    async with Session.from_args(args) as session:
+        try:
+            yield session
+        finally:
+            session.metrics.write(args.metrics_json, args.metrics_prometheus)
+
+
+async def clean_up(args):
+    if args.resume:
+        journal = Journal(args.resume)
+        try:
+            async with run_session(args) as session:
+                return await resume_clean_up(args, session, journal)
+        finally:
+            journal.close()
+
+    rules = rules_from_args(args, datetime.now(UTC))
+    cache = InventoryCache.from_args(args, min(rule.retention_days for rule in rules))
+    if cache:
+        evicted = cache.evict()
+        logging.info(f"Evicted {evicted} stale packages from the inventory cache.")
+    journal = Journal(args.journal) if args.journal else None
+    report = ExpiryReport(args.report_out)
+    try:
+        async with run_session(args) as session:
+            # A plan is written in one go, however many regions it covers.
+            if len(split_rules_by_region(rules)) > 1 and not args.plan_out:
+                return await clean_up_regions(
+                    args, session, rules, cache, journal, report
+                )
+            return await scan_and_clean_up(args, session, cache, journal, report, rules)
+    finally:
+        report.close()
+        if cache:
+            cache.close()
+        if journal:
+            journal.close()
+
+
+def clean_up_shard(args):
+    return asyncio.run(clean_up(args))
+
+
+def shard_args(args):
+    """Split the shard of a run into `args.processes` shards, one per process.
+
+    A package of shard `i` out of `n` belongs to one of the shards `i + n * k`
+    out of `n * processes`, so the processes of a worker cover the same packages
+    as the worker would on its own.
+    """
+    return [
+        argparse.Namespace(
+            **{
+                **vars(args),
+                "shard_index": args.shard_index + args.shard_count * process,
+                "shard_count": args.shard_count * args.processes,
+                "processes": 1,
+            }
+        )
+        for process in range(args.processes)
+    ]
+
+
+def clean_up_processes(args):
+    """Run the clean-up in a pool of processes, each scanning and deleting a shard."""
+    # Child processes mustn't inherit gRPC state, so don't fork them.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.processes, mp_context=context) as executor:
+        summaries = list(executor.map(clean_up_shard, shard_args(args)))
+    summary = CleanUpSummary.merge(summaries)
+    logging.info(f"Totals of the {args.processes} processes:")
+    summary.log()
+    return summary
+
+
+async def snapshot_package(package, semaphore, session, writer):
+    """List every version of a package into a snapshot, returning how many."""
+    async with semaphore:
+        versions = await list_versions(package, session=session)
+        rows = [
+            (os.path.basename(version.name), version.create_time.timestamp())
+            async for version in paged(versions, "versions", session, "list_versions")
+        ]
+    writer.add_package(package.name, rows)
+    return len(rows)
+
+
+async def snapshot_repository(
+    region, repository_name, pattern, semaphore, session, writer
+):
+    """Snapshot the packages of a repository matching `pattern`, one task per package."""
+    repository = await get_repository(region, repository_name, session=session)
+    packages = await list_packages(repository, session=session)
+    snapshots = []
+    async with asyncio.TaskGroup() as group:
+        async for package in paged(packages, "packages", session, "list_packages"):
+            if pattern.match(os.path.basename(package.name)):
+                snapshots.append(
+                    group.create_task(
+                        snapshot_package(package, semaphore, session, writer)
+                    )
+                )
+    return [snapshot.result() for snapshot in snapshots]
+
+
+async def write_snapshot(args, session, writer):
+    """Snapshot every repository of --repository and --region concurrently.
+
+    Returns the number of versions of each package written.
+    """
+    pattern = re.compile(args.package)
+    semaphore = asyncio.Semaphore(args.scan_concurrency)
+    # A failing repository cancels the others, so none of them writes to the
+    # snapshot once it's discarded.
+    async with asyncio.TaskGroup() as group:
+        results = [
+            group.create_task(
+                snapshot_repository(
+                    region, repository_name, pattern, semaphore, session, writer
+                )
+            )
+            for region, repository_name in repository_regions(args)
+        ]
+    return [
+        count for repository_counts in results for count in repository_counts.result()
+    ]
+
+
+async def take_inventory(args):
+    start = time.time()
+    with SnapshotWriter(args.output) as writer:
+        async with run_session(args) as session:
+            counts = await write_snapshot(args, session, writer)
+    logging.info(
+        f"Wrote {sum(counts)} versions of {len(counts)} packages to {args.output} "
+        f"in {int(time.time() - start)} seconds."
     )
 
-    args = parser.parse_args()
-    logging.info(f"Parsed arguments:\nargs = {json.dumps(vars(args), indent=4)}")
 
-    if args.command == "clean-up":
-        asyncio.run(clean_up(args))
-        logging.info("Done cleaning up!")
+async def apply_plan(args):
+    batches = read_plan(args.plan, args.shard_index, args.shard_count)
+    logging.info(
+        f"Applying shard {args.shard_index} of {args.shard_count} of {args.plan}..."
+    )
+    journal = Journal(args.journal) if args.journal else None
+    try:
+        async with run_session(args) as session:
+            return await delete_batches(
+                args,
+                session,
+                ((None, package, names) for package, names in batches),
+                journal,
+            )
+    finally:
+        if journal:
+            journal.close()
@@ -0,0 +1,179 @@
+import re
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import yaml
+
+from mozilla_linux_pkg_manager.policy import RetentionPolicy
+
+RULE_KEYS = {
+    "region",
+    "repository",
+    "package",
+    "retention-days",
+    "keep-latest-per-major",
+    "keep-esr",
+}
+
+
+@dataclass
+class Rule:
+    """Clean-up rule for the packages of a repository matching a regex."""
+
+    region: str
+    repository: str
+    package: str
+    retention_days: int
+    cutoff: float
+    policy: RetentionPolicy | None = None
+    # Names of the packages the rule matched during the scan.
+    packages: list = field(default_factory=list)
+
+
+def rules_from_args(args, now):
+    """Return the rules of a clean-up, from its --config file or its options."""
+    if args.config:
+        return load_rules(args.config, now)
+    return [
+        Rule(
+            region=region,
+            repository=repository,
+            package=args.package,
+            retention_days=args.retention_days,
+            cutoff=(now - timedelta(days=args.retention_days)).timestamp(),
+            policy=RetentionPolicy.from_args(args),
+        )
+        for region, repository in repository_regions(args)
+    ]
+
+
+def repository_regions(args):
+    """Return the `(region, repository)` pairs of --repository and --region.
+
+    Repositories given as `region/repository` are only in that region, the
+    others in every --region.
+    """
+    pairs = []
+    for repository in args.repository:
+        region, _, repository = repository.rpartition("/")
+        regions = [region] if region else args.region
+        pairs += [(region, repository) for region in regions]
+    return pairs
+
+
+def load_rules(path, now):
+    """Load the rules of a YAML config file.
+
+    The file has a list of `rules`, each with a `repository` (or a list of
+    them), a `package` regex and `retention-days`, and optionally a `region`
+    (defaulting to the top-level `region`), `keep-latest-per-major` and
+    `keep-esr`. Raises ValueError on invalid configs.
+    """
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    if not isinstance(config, dict) or not isinstance(config.get("rules"), list):
+        raise ValueError(f"{path} doesn't have a list of rules")
+
+    rules = []
+    for index, entry in enumerate(config["rules"]):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Rule {index} of {path} isn't a mapping")
+        if unknown := set(entry) - RULE_KEYS:
+            raise ValueError(
+                f"Rule {index} of {path} has unknown keys: {', '.join(sorted(unknown))}"
+            )
+        region = entry.get("region", config.get("region"))
+        missing = [
+            key
+            for key in ("repository", "package", "retention-days")
+            if key not in entry
+        ]
+        if region is None:
+            missing.append("region")
+        if missing:
+            raise ValueError(f"Rule {index} of {path} is missing: {', '.join(missing)}")
+        if not isinstance(entry["retention-days"], int):
+            raise ValueError(f"Rule {index} of {path} has non-integer retention-days")
+        try:
+            re.compile(entry["package"])
+        except re.error as e:
+            raise ValueError(f"Rule {index} of {path} has an invalid regex: {e}")
+
+        repositories = entry["repository"]
+        if isinstance(repositories, str):
+            repositories = [repositories]
+        policy = None
+        if entry.get("keep-latest-per-major") or entry.get("keep-esr"):
+            policy = RetentionPolicy(
+                entry.get("keep-latest-per-major", 0), entry.get("keep-esr", False)
+            )
+        for repository in repositories:
+            rules.append(
+                Rule(
+                    region=region,
+                    repository=repository,
+                    package=entry["package"],
+                    retention_days=entry["retention-days"],
+                    cutoff=(now - timedelta(days=entry["retention-days"])).timestamp(),
+                    policy=policy,
+                )
+            )
+    try:
+        group_rules(rules)
+    except re.error as e:
+        raise ValueError(f"The rules of {path} can't be combined: {e}")
+    return rules
+
+
+def split_rules_by_region(rules):
+    """Map each region to its rules."""
+    split = {}
+    for rule in rules:
+        split.setdefault(rule.region, []).append(rule)
+    return split
+
+
+def group_rules(rules):
+    """Map each `(region, repository)` to a `RuleMatcher` of its rules."""
+    grouped = {}
+    for rule in rules:
+        grouped.setdefault((rule.region, rule.repository), []).append(rule)
+    return {key: RuleMatcher(rules) for key, rules in grouped.items()}
+
+
+class RuleMatcher:
+    """Match package names against every rule of a repository in a single pass.
+
+    The rules' regexes are combined into one alternation with a named group per
+    rule, so each package name is matched once whatever the number of rules.
+    When several rules match a package, the first one wins. Regexes with
+    capturing groups (which backreferences refer to by number) or global flags
+    don't mean the same inside the alternation, so when a repository has any,
+    its rules are matched one at a time instead.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.patterns = [re.compile(rule.package) for rule in rules]
+        self.pattern = None
+        if len(rules) > 1 and all(
+            not pattern.groups and pattern.flags == re.UNICODE
+            for pattern in self.patterns
+        ):
+            self.pattern = re.compile(
+                "|".join(
+                    f"(?P<rule{index}>{rule.package})"
+                    for index, rule in enumerate(rules)
+                )
+            )
+
+    def match(self, package_name):
+        if self.pattern is None:
+            for rule, pattern in zip(self.rules, self.patterns):
+                if pattern.match(package_name):
+                    return rule
+            return None
+        match = self.pattern.match(package_name)
+        if not match:
+            return None
+        return self.rules[int(match.lastgroup.removeprefix("rule"))]
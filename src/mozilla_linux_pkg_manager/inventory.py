@@ -0,0 +1,134 @@
+import heapq
+from array import array
+
+
+class VersionInventory:
+    """Compact, column-oriented inventory of package versions.
+
+    Instead of full resource names, every package name is stored once and its
+    versions are referred to by their name within the package. Version names are
+    interned across packages, since the l10n packages of a product all share the
+    same versions. Each package gets two array-backed columns: the ids of its
+    version names and their creation time in epoch seconds.
+    """
+
+    def __init__(self):
+        self.packages = []
+        self.package_ids = {}
+        self.versions = []
+        self.version_ids = {}
+        self.version_columns = []
+        self.create_time_columns = []
+
+    def __len__(self):
+        return sum(len(column) for column in self.version_columns)
+
+    def add_package(self, name):
+        package_id = self.package_ids.get(name)
+        if package_id is None:
+            package_id = self.package_ids[name] = len(self.packages)
+            self.packages.append(name)
+            self.version_columns.append(array("I"))
+            self.create_time_columns.append(array("q"))
+        return package_id
+
+    def add(self, package_id, version, create_time):
+        version_id = self.version_ids.get(version)
+        if version_id is None:
+            version_id = self.version_ids[version] = len(self.versions)
+            self.versions.append(version)
+        self.version_columns[package_id].append(version_id)
+        self.create_time_columns[package_id].append(int(create_time))
+
+    def expired(self, cutoff, package_ids=None):
+        """Select the versions created before `cutoff`, of `package_ids` or all packages.
+
+        Returns the selected rows of each package that has any, by package id.
+        """
+        if package_ids is None:
+            package_ids = range(len(self.packages))
+        selection = {}
+        for package_id in package_ids:
+            create_times = self.create_time_columns[package_id]
+            rows = array(
+                "I",
+                (
+                    row
+                    for row, create_time in enumerate(create_times)
+                    if create_time < cutoff
+                ),
+            )
+            if rows:
+                selection[package_id] = rows
+        return selection
+
+    def targets(self, selection):
+        """Map the name of each selected package to the names of its selected versions.
+
+        Packages are sorted by name so the output doesn't depend on the order
+        the scan added them in.
+        """
+        return {
+            self.packages[package_id]: VersionNames(self, package_id, rows)
+            for package_id, rows in sorted(
+                selection.items(), key=lambda item: self.packages[item[0]]
+            )
+        }
+
+    def batches_by_age(self, selection, batch_size):
+        """Yield `(package, names)` batches of a selection, oldest versions first.
+
+        `batch_size` is a callable returning the size of the next batch of a
+        package. Batches only hold versions of a single package, so a heap
+        keyed on the oldest version each package has left picks the package of
+        the next batch, and a run cut short deletes the most overdue versions.
+        """
+        sorted_rows = {}
+        heap = []
+        for package_id, rows in selection.items():
+            create_times = self.create_time_columns[package_id]
+            rows = sorted_rows[package_id] = array(
+                "I", sorted(rows, key=create_times.__getitem__)
+            )
+            heap.append((create_times[rows[0]], package_id, 0))
+        heapq.heapify(heap)
+        while heap:
+            _, package_id, start = heap[0]
+            package = self.packages[package_id]
+            rows = sorted_rows[package_id]
+            end = start + batch_size(package)
+            yield package, tuple(VersionNames(self, package_id, rows[start:end]))
+            if end < len(rows):
+                create_time = self.create_time_columns[package_id][rows[end]]
+                heapq.heapreplace(heap, (create_time, package_id, end))
+            else:
+                heapq.heappop(heap)
+
+    def unique_versions(self, selection):
+        """Return the distinct version names of a selection, across packages."""
+        version_ids = set()
+        for package_id, rows in selection.items():
+            column = self.version_columns[package_id]
+            version_ids.update(column[row] for row in rows)
+        return sorted(self.versions[version_id] for version_id in version_ids)
+
+
+class VersionNames:
+    """Full resource names of some versions of a package, built on demand."""
+
+    __slots__ = ("inventory", "package_id", "rows")
+
+    def __init__(self, inventory, package_id, rows):
+        self.inventory = inventory
+        self.package_id = package_id
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        prefix = f"{self.inventory.packages[self.package_id]}/versions/"
+        versions = self.inventory.versions
+        column = self.inventory.version_columns[self.package_id]
+        for row in self.rows:
+            yield prefix + versions[column[row]]
@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+
+
+class Journal:
+    """Write-ahead journal of the batch delete operations of a clean-up run.
+
+    The journal is a JSON Lines file. A `{"batch": id, "parent": ..., "names": [...]}`
+    record is written for each batch before it's submitted, and a `{"done": id}`
+    record once its operation succeeded. Records are appended to the file, so a
+    resumed run keeps writing to the journal it resumes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.next_id = 0
+        if os.path.exists(path):
+            for record in self.records():
+                if "batch" in record:
+                    self.next_id = max(self.next_id, record["batch"] + 1)
+        self.file = open(path, "a")
+        if self.file.tell() and not self.ends_with_newline():
+            # Don't append to a truncated record.
+            self.file.write("\n")
+
+    def ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self):
+        self.file.close()
+
+    def records(self):
+        with open(self.path) as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # The run died halfway through writing this record.
+                    logging.warning(
+                        f"Ignoring truncated record on line {line_number} of {self.path}"
+                    )
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def plan(self, package, names, sync=True):
+        """Record a batch about to be submitted and return its id."""
+        batch_id = self.next_id
+        self.next_id += 1
+        self.write({"batch": batch_id, "parent": package, "names": list(names)})
+        if sync:
+            self.sync()
+        return batch_id
+
+    def done(self, batch_id):
+        self.write({"done": batch_id})
+        self.sync()
+
+    def pending(self):
+        """Return the `(id, parent, names)` of the planned batches that aren't done.
+
+        The batches are read in full, so the ones planned while they're being
+        retried (like the halves of a split batch) aren't retried twice.
+        """
+        self.sync()
+        done = {record["done"] for record in self.records() if "done" in record}
+        return [
+            (record["batch"], record["parent"], record["names"])
+            for record in self.records()
+            if "batch" in record and record["batch"] not in done
+        ]
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+# Errors telling us to slow down, as opposed to errors that are worth retrying
+# but say nothing about how hard we're pushing the API.
+OVERLOAD_TYPES = (
+    api_exceptions.TooManyRequests,  # 429
+    api_exceptions.ServiceUnavailable,  # 503
+)
+
+
+class AdaptiveLimiter:
+    """Limit on concurrent API calls shared by a whole run, adjusted with AIMD."""
+
+    def __init__(self, maximum, minimum=1, cooldown=1.0, log_interval=30.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.cooldown = cooldown
+        self.log_interval = log_interval
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.last_decrease = 0
+        self.completed = 0
+        self.overloads = 0
+        self.last_log = time.monotonic()
+        self.completed_at_last_log = 0
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self.condition:
+            self.in_flight -= 1
+            if exc_type is None:
+                self.on_success()
+            self.condition.notify_all()
+
+    def on_success(self):
+        self.completed += 1
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self.maybe_log()
+
+    def on_error(self, exc):
+        if not isinstance(exc, OVERLOAD_TYPES):
+            return
+        self.overloads += 1
+        now = time.monotonic()
+        if now - self.last_decrease >= self.cooldown:
+            self.last_decrease = now
+            self.limit = max(self.minimum, self.limit / 2)
+            logging.warning(
+                f"Got {type(exc).__name__}, lowering the limit to {int(self.limit)} concurrent requests."
+            )
+        self.maybe_log()
+
+    def maybe_log(self):
+        now = time.monotonic()
+        if now - self.last_log < self.log_interval:
+            return
+        rate = (self.completed - self.completed_at_last_log) / (now - self.last_log)
+        logging.info(
+            f"Allowing {int(self.limit)} concurrent requests ({self.in_flight} in flight), "
+            f"completing {rate:.1f} requests per second, {self.overloads} overload errors so far."
+        )
+        self.last_log = now
+        self.completed_at_last_log = self.completed
+
+
+# Errors hinting that batches are too large for the service to handle in time.
+TOO_LARGE_TYPES = (
+    api_exceptions.DeadlineExceeded,  # 504
+    api_exceptions.InvalidArgument,  # 400
+)
+
+
+class BatchSizer:
+    """Size of the batch delete requests of a repository, adjusted from their outcome."""
+
+    def __init__(self, initial, maximum, minimum=1, target_seconds=30.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.target_seconds = target_seconds
+        self.size = min(initial, maximum)
+        self.largest = self.size
+        self.changes = 0
+
+    def resize(self, size):
+        size = max(self.minimum, min(self.maximum, size))
+        if size != self.size:
+            self.size = size
+            self.largest = max(self.largest, size)
+            self.changes += 1
+
+    def on_success(self, size, seconds):
+        if size < self.size:
+            return
+        if seconds > self.target_seconds:
+            self.resize(self.size // 2)
+        else:
+            self.resize(self.size * 2)
+
+    def on_error(self, size, exc):
+        if isinstance(exc, api_exceptions.RetryError):
+            exc = exc.cause
+        if size >= self.size and isinstance(exc, TOO_LARGE_TYPES):
+            self.resize(self.size // 2)
@@ -0,0 +1,455 @@
+"""Entry point of mozilla-linux-pkg-manager.
+
+Parsing and validating arguments, and commands that never call the API, only
+need the standard library. The Google Cloud client libraries, which take far
+longer to import than everything else, are only loaded with `cli` once a
+command needs them.
+"""
+
+import argparse
+import dataclasses
+import json
+import logging
+from datetime import UTC, datetime
+
+from mozilla_linux_pkg_manager.summary import CleanUpSummary
+
+logging.basicConfig(
+    format="%(asctime)s - %(funcName)s - %(message)s",
+    level=logging.INFO,
+)
+
+
+def positive_int(value):
+    """Argparse type for options that only make sense with a value of 1 or more."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
+def non_negative_int(value):
+    """Argparse type for options whose value of 0 disables something."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is a negative integer")
+    return number
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="mozilla-linux-pkg-manager")
+    subparsers = parser.add_subparsers(
+        dest="command",
+        required=True,
+        help='Sub-commands ("clean-up", "apply", "merge-summaries", "inventory" or "inventory-summary")',
+    )
+
+    # Options of every command that calls the API
+    api_parser = argparse.ArgumentParser(add_help=False)
+    api_parser.add_argument(
+        "--max-concurrent-requests",
+        type=non_negative_int,
+        default=64,
+        help="Upper bound of the adaptive limit on concurrent API calls, which shrinks on 429/503 errors and grows back on success (0 disables it)",
+    )
+    api_parser.add_argument(
+        "--grpc-channels",
+        type=positive_int,
+        default=1,
+        help="Number of gRPC channels (connections) to Artifact Registry shared by the whole run",
+    )
+    api_parser.add_argument(
+        "--grpc-keepalive-seconds",
+        type=int,
+        default=0,
+        help="Interval between keepalive pings on idle gRPC channels (0 disables them)",
+    )
+    api_parser.add_argument(
+        "--prefetch-pages",
+        type=non_negative_int,
+        default=1,
+        metavar="N",
+        help="Number of pages of each package and version listing fetched in the background ahead of the one being processed (0 disables prefetching)",
+    )
+    api_parser.add_argument(
+        "--metrics-json",
+        type=str,
+        metavar="PATH",
+        default=None,
+        help="Write API call latencies, page and retry counts, phase durations and the memory high-water mark of the run to this JSON file",
+    )
+    api_parser.add_argument(
+        "--metrics-prometheus",
+        type=str,
+        metavar="PATH",
+        default=None,
+        help="Write the metrics of the run to this file in the Prometheus text format",
+    )
+
+    # Options of every command that deletes versions
+    delete_parser = argparse.ArgumentParser(add_help=False, parents=[api_parser])
+    delete_parser.add_argument(
+        "--delete-concurrency",
+        type=positive_int,
+        default=1,
+        help="Maximum number of batch delete operations in flight at once",
+    )
+    delete_parser.add_argument(
+        "--max-requests-per-second",
+        type=float,
+        default=0,
+        help="Maximum number of batch delete requests sent to each repository per second (0 means no limit)",
+    )
+    delete_parser.add_argument(
+        "--max-batch-size",
+        type=positive_int,
+        default=None,
+        help="Grow batch delete requests up to this many versions while their operations complete quickly (defaults to 50, which never grows them)",
+    )
+    delete_parser.add_argument(
+        "--validate-sample",
+        type=positive_int,
+        default=0,
+        help="With --dry-run, have Artifact Registry validate the first batch of up to this many packages, instead of only checking batches locally",
+    )
+    delete_parser.add_argument(
+        "--journal",
+        type=str,
+        default=None,
+        help="Write-ahead journal recording the planned batch deletions and the ones that succeeded",
+    )
+    delete_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Check the versions to delete locally instead of deleting them, and print out a summary of the operations that would be executed",
+        default=False,
+    )
+
+    # Subparser for the 'clean-up' command
+    clean_up_parser = subparsers.add_parser(
+        "clean-up", parents=[delete_parser], help="Clean up package versions."
+    )
+    clean_up_parser.add_argument(
+        "--package",
+        type=str,
+        help='A regex that matches the name of the packages to clean-up (ex. "firefox-nightly-.*")',
+    )
+    clean_up_parser.add_argument(
+        "--repository",
+        type=str,
+        nargs="+",
+        help="One or more repository names to clean up, in every --region, or as region/repository to clean up a repository of a single region",
+    )
+    clean_up_parser.add_argument(
+        "--region",
+        type=str,
+        nargs="+",
+        help="One or more regions of the repositories, each scanned and cleaned up concurrently with its own concurrency and rate budget",
+    )
+    clean_up_parser.add_argument(
+        "--retention-days",
+        type=int,
+        help="Retention period in days for the selected packages",
+    )
+    clean_up_parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="YAML file of clean-up rules for several repositories and packages, instead of --package, --repository, --region and --retention-days",
+    )
+    clean_up_parser.add_argument(
+        "--keep-latest-per-major",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Keep the newest N versions of each major version of a package, even once they're expired",
+    )
+    clean_up_parser.add_argument(
+        "--keep-esr",
+        action="store_true",
+        default=False,
+        help="Keep every ESR version, even once they're expired",
+    )
+    clean_up_parser.add_argument(
+        "--server-filter",
+        action="store_true",
+        default=False,
+        help="Ask Artifact Registry to only list expired versions, falling back to filtering them client-side when it can't",
+    )
+    clean_up_parser.add_argument(
+        "--scan-concurrency",
+        type=positive_int,
+        default=1,
+        help="Maximum number of packages whose versions are listed concurrently",
+    )
+    clean_up_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Start deleting expired versions while the scan is still running, instead of after it",
+        default=False,
+    )
+    clean_up_parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory of an on-disk inventory of package versions, reused by later runs instead of listing every version again",
+    )
+    clean_up_parser.add_argument(
+        "--cache-ttl-hours",
+        type=float,
+        default=12,
+        help="How long a package's cached versions are trusted before listing them again (never longer than the retention period)",
+    )
+    clean_up_parser.add_argument(
+        "--cache-max-age-days",
+        type=float,
+        default=30,
+        help="Evict packages from the cache when they haven't been refreshed for this long",
+    )
+    clean_up_parser.add_argument(
+        "--resume",
+        type=str,
+        metavar="JOURNAL",
+        default=None,
+        help="Skip the scan and run the batches of an interrupted run's journal that didn't succeed",
+    )
+    clean_up_parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=0,
+        help="Only scan and clean up the packages of this shard (starting at 0), assigned by a hash of their name",
+    )
+    clean_up_parser.add_argument(
+        "--shard-count",
+        type=positive_int,
+        default=1,
+        help="Number of shards the packages are spread over",
+    )
+    clean_up_parser.add_argument(
+        "--processes",
+        type=positive_int,
+        default=1,
+        help="Split the packages of the run over this many worker processes",
+    )
+    clean_up_parser.add_argument(
+        "--summary-out",
+        type=str,
+        default=None,
+        help="Write the totals of the run to this JSON file, to be combined with merge-summaries",
+    )
+    clean_up_parser.add_argument(
+        "--report-out",
+        type=str,
+        default=None,
+        help="Write every expired version to this JSON Lines file, instead of only logging aggregated stats",
+    )
+    clean_up_parser.add_argument(
+        "--plan-out",
+        type=str,
+        default=None,
+        help="Write the versions to delete to this plan file, to be deleted by the apply command, instead of deleting them",
+    )
+    clean_up_parser.add_argument(
+        "--max-runtime",
+        type=positive_int,
+        default=None,
+        metavar="SECONDS",
+        help="Stop starting batch delete requests when they might not finish within this many seconds of the start of the run, deleting the oldest versions first",
+    )
+    clean_up_parser.add_argument(
+        "--skip-delete",
+        action="store_true",
+        help='Skip the "delete versions" step (for testing)',
+        default=False,
+    )
+
+    # Subparser for the 'apply' command
+    apply_parser = subparsers.add_parser(
+        "apply",
+        parents=[delete_parser],
+        help="Delete the package versions of a plan written by clean-up --plan-out.",
+    )
+    apply_parser.add_argument(
+        "--plan",
+        type=str,
+        required=True,
+        help="Plan file written by clean-up --plan-out",
+    )
+    apply_parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=0,
+        help="Only apply the batches of this shard of the plan (starting at 0)",
+    )
+    apply_parser.add_argument(
+        "--shard-count",
+        type=positive_int,
+        default=1,
+        help="Number of shards the batches of the plan are spread over",
+    )
+
+    # Subparser for the 'merge-summaries' command
+    merge_parser = subparsers.add_parser(
+        "merge-summaries",
+        help="Log the totals of the shards of a clean-up from their --summary-out files.",
+    )
+    merge_parser.add_argument(
+        "summaries",
+        nargs="+",
+        help="Summary files written by clean-up --summary-out",
+    )
+
+    # Subparser for the 'inventory' command
+    inventory_parser = subparsers.add_parser(
+        "inventory",
+        parents=[api_parser],
+        help="Write a snapshot of every version of some packages, to be read by inventory-summary.",
+    )
+    inventory_parser.add_argument(
+        "--package",
+        type=str,
+        default="",
+        help="A regex that matches the name of the packages to list (defaults to every package)",
+    )
+    inventory_parser.add_argument(
+        "--repository",
+        type=str,
+        nargs="+",
+        required=True,
+        help="One or more repository names to list, in every --region, or as region/repository",
+    )
+    inventory_parser.add_argument(
+        "--region",
+        type=str,
+        nargs="+",
+        help="One or more regions of the repositories",
+    )
+    inventory_parser.add_argument(
+        "--scan-concurrency",
+        type=positive_int,
+        default=1,
+        help="Maximum number of packages whose versions are listed concurrently",
+    )
+    inventory_parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        metavar="PATH",
+        help="Snapshot file to write",
+    )
+
+    # Subparser for the 'inventory-summary' command
+    inventory_summary_parser = subparsers.add_parser(
+        "inventory-summary",
+        help="Log the version counts and ages of the packages of a snapshot written by inventory.",
+    )
+    inventory_summary_parser.add_argument(
+        "snapshot",
+        help="Snapshot file written by inventory --output",
+    )
+    inventory_summary_parser.add_argument(
+        "--top",
+        type=positive_int,
+        default=10,
+        metavar="N",
+        help="Number of packages with the most versions to log",
+    )
+
+    return parser
+
+
+def has_region(args):
+    """Whether every --repository has a region, from --region or a region/ prefix."""
+    return args.region is not None or (
+        args.repository is not None and all("/" in name for name in args.repository)
+    )
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.command == "clean-up" and not (args.resume or args.config):
+        missing = [
+            option
+            for option, present in (
+                ("--package", args.package is not None),
+                ("--repository", args.repository is not None),
+                ("--region", has_region(args)),
+                ("--retention-days", args.retention_days is not None),
+            )
+            if not present
+        ]
+        if missing:
+            parser.error(
+                f"the following arguments are required without --resume or --config: {', '.join(missing)}"
+            )
+    if args.command == "clean-up" and args.config:
+        import yaml  # noqa: PLC0415
+
+        from mozilla_linux_pkg_manager.config import load_rules  # noqa: PLC0415
+
+        try:
+            load_rules(args.config, datetime.now(UTC))
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            parser.error(f"invalid --config: {e}")
+    if args.command == "inventory" and not has_region(args):
+        parser.error("the following arguments are required: --region")
+    if args.command in ("clean-up", "apply") and not (
+        0 <= args.shard_index < args.shard_count
+    ):
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+    if args.command == "clean-up" and args.max_runtime:
+        for option in ("stream", "resume"):
+            if getattr(args, option):
+                parser.error(f"--max-runtime can't be used with --{option}")
+    if args.command == "clean-up" and args.processes > 1:
+        for option in (
+            "resume",
+            "journal",
+            "plan_out",
+            "metrics_json",
+            "metrics_prometheus",
+            "report_out",
+        ):
+            if getattr(args, option):
+                parser.error(
+                    f"--{option.replace('_', '-')} can't be used with --processes"
+                )
+    logging.info(f"Parsed arguments:\nargs = {json.dumps(vars(args), indent=4)}")
+
+    if args.command in ("clean-up", "apply", "inventory"):
+        # Only the commands calling the API pay for loading its client libraries.
+        import asyncio  # noqa: PLC0415
+
+        from mozilla_linux_pkg_manager import cli  # noqa: PLC0415
+
+    if args.command == "clean-up":
+        if args.processes > 1:
+            summary = cli.clean_up_processes(args)
+        else:
+            summary = asyncio.run(cli.clean_up(args))
+        if args.summary_out:
+            with open(args.summary_out, "w") as f:
+                json.dump(dataclasses.asdict(summary), f)
+        logging.info("Done cleaning up!")
+    elif args.command == "apply":
+        summary = asyncio.run(cli.apply_plan(args))
+        logging.info("Done applying the plan!")
+    elif args.command == "inventory":
+        asyncio.run(cli.take_inventory(args))
+        return
+    elif args.command == "inventory-summary":
+        from mozilla_linux_pkg_manager.snapshot import Snapshot  # noqa: PLC0415
+
+        Snapshot(args.snapshot).log(top=args.top)
+        return
+    elif args.command == "merge-summaries":
+        summaries = []
+        for path in args.summaries:
+            with open(path) as f:
+                summaries.append(CleanUpSummary(**json.load(f)))
+        summary = CleanUpSummary.merge(summaries)
+        summary.log()
+
+    if summary.failed_batches:
+        exit(1)
@@ -0,0 +1,152 @@
+import contextlib
+import json
+import resource
+import sys
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+# Upper bounds in seconds of the latency histogram buckets, from a fast RPC to a
+# slow long-running operation.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# Upper bounds of the batch size histogram buckets.
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, like Prometheus histograms."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "buckets": {str(bound): count for bound, count in self.cumulative_counts()},
+        }
+
+
+class Metrics:
+    """Counters and latency histograms of a run, with labels.
+
+    Everything is recorded under a metric name and a set of labels (for
+    instance `rpc_seconds` with `method` and `repository` labels), and can be
+    exported as a JSON report or in the Prometheus text format. Per-package
+    figures are only kept for the JSON report, since a label per package would
+    make for far too many Prometheus series.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.counters = defaultdict(int)
+        self.histograms = {}
+        self.packages = defaultdict(lambda: defaultdict(float))
+
+    def increment(self, name, amount=1, **labels):
+        self.counters[name, tuple(sorted(labels.items()))] += amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = name, tuple(sorted(labels.items()))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        self.histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_package(self, package, **values):
+        for key, value in values.items():
+            self.packages[package][key] += value
+
+    @staticmethod
+    def max_rss_bytes():
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kibibytes, macOS bytes.
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    def to_dict(self):
+        return {
+            "elapsed_seconds": time.time() - self.start,
+            "max_rss_bytes": self.max_rss_bytes(),
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ],
+            "packages": {
+                package: dict(values)
+                for package, values in sorted(self.packages.items())
+            },
+        }
+
+    def to_prometheus(self, prefix="mozilla_linux_pkg_manager_"):
+        lines = [
+            f"# TYPE {prefix}elapsed_seconds gauge",
+            f"{prefix}elapsed_seconds {time.time() - self.start}",
+            f"# TYPE {prefix}max_rss_bytes gauge",
+            f"{prefix}max_rss_bytes {self.max_rss_bytes()}",
+        ]
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {prefix}{name} counter")
+            lines.append(f"{prefix}{name}{format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {prefix}{name} histogram")
+            for bound, count in histogram.cumulative_counts():
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(
+                    f"{prefix}{name}_bucket{format_labels((*labels, ('le', le)))} {count}"
+                )
+            lines.append(f"{prefix}{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(
+                f"{prefix}{name}_count{format_labels(labels)} {histogram.count}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path=None, prometheus_path=None):
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(self.to_dict(), f, indent=4)
+        if prometheus_path:
+            with open(prometheus_path, "w") as f:
+                f.write(self.to_prometheus())
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
@@ -0,0 +1,47 @@
+import json
+from itertools import batched
+
+
+def write_plan(path, targets, batch_size):
+    """Write the versions to delete of each package to a JSON Lines plan file.
+
+    Each package gets a `{"package": name, "count": n}` record, followed by
+    `{"versions": [...]}` records of up to `batch_size` version names within the
+    package, one for each batch delete request. Returns the number of batches.
+    """
+    batch_count = 0
+    with open(path, "w") as f:
+        for package, names in targets.items():
+            prefix = f"{package}/versions/"
+            f.write(json.dumps({"package": package, "count": len(names)}) + "\n")
+            for batch in batched(names, batch_size):
+                versions = [name.removeprefix(prefix) for name in batch]
+                f.write(json.dumps({"versions": versions}) + "\n")
+                batch_count += 1
+    return batch_count
+
+
+def read_plan(path, shard_index=0, shard_count=1):
+    """Yield the `(package, names)` batches of a plan file.
+
+    Batches are spread round-robin over `shard_count` shards, and only those of
+    shard `shard_index` are yielded, so several processes can apply one plan.
+    """
+    package = None
+    batch_index = 0
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            record = json.loads(line)
+            if "package" in record:
+                package = record["package"]
+            elif "versions" in record:
+                if package is None:
+                    raise ValueError(
+                        f"Versions without a package on line {line_number} of {path}"
+                    )
+                if batch_index % shard_count == shard_index:
+                    prefix = f"{package}/versions/"
+                    yield package, [prefix + version for version in record["versions"]]
+                batch_index += 1
+            else:
+                raise ValueError(f"Unknown record on line {line_number} of {path}")
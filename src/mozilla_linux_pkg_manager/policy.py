@@ -0,0 +1,100 @@
+import functools
+import re
+import urllib.parse
+from array import array
+
+from mozilla_version.gecko import FirefoxVersion
+
+# Debian-only parts of a version: an epoch, a build id or build number after a
+# tilde, and a revision.
+EPOCH = re.compile(r"^\d+:")
+DEBIAN_SUFFIX = re.compile(r"(~(?:build(\d+)|(\d{14})))?(-[0-9A-Za-z.+~]+)?$")
+
+
+@functools.cache
+def parse_version(version):
+    """Parse the Debian version of a package into a `FirefoxVersion`.
+
+    Debian spells pre-releases with a tilde (`130.0~b2`) so they sort before the
+    release, and nightlies carry their build id (`131.0a1~20240801094424`).
+    Returns None for versions that aren't Firefox versions. Results are cached,
+    since the l10n packages of a product share the same versions.
+    """
+    version = urllib.parse.unquote(version)
+    version = DEBIAN_SUFFIX.sub("", EPOCH.sub("", version), count=1)
+    version = version.replace("~", "")
+    try:
+        return FirefoxVersion.parse(version)
+    except ValueError:
+        return None
+
+
+@functools.cache
+def build_number(version):
+    """Return the build id or build number of a Debian version, or 0 without one.
+
+    Tells apart versions that `parse_version` parses the same, like the nightlies
+    of a major.
+    """
+    match = DEBIAN_SUFFIX.search(EPOCH.sub("", urllib.parse.unquote(version)))
+    return int(match.group(2) or match.group(3) or 0)
+
+
+class RetentionPolicy:
+    """Versions to keep regardless of their age.
+
+    `keep_latest_per_major` keeps the newest N versions of each major version
+    of a package, and `keep_esr` keeps every ESR release. Versions that can't be
+    parsed only expire by age.
+    """
+
+    def __init__(self, keep_latest_per_major=0, keep_esr=False):
+        self.keep_latest_per_major = keep_latest_per_major
+        self.keep_esr = keep_esr
+
+    @classmethod
+    def from_args(cls, args):
+        """Return the policy of the run, or None when it has no rules."""
+        if not (args.keep_latest_per_major or args.keep_esr):
+            return None
+        return cls(args.keep_latest_per_major, args.keep_esr)
+
+    def protected(self, versions):
+        """Return the indices of the `versions` of a package that must be kept."""
+        parsed = [parse_version(version) for version in versions]
+        protected = set()
+        if self.keep_esr:
+            protected.update(
+                index
+                for index, version in enumerate(parsed)
+                if version and version.is_esr
+            )
+        if self.keep_latest_per_major:
+            # Sort the package's versions once, newest first, then keep the
+            # first ones of each major. Builds of the same version, like
+            # nightlies, are sorted by their build id or build number.
+            builds = [build_number(version) for version in versions]
+            kept = {}
+            for index in sorted(
+                (index for index, version in enumerate(parsed) if version),
+                key=lambda index: (parsed[index], builds[index]),
+                reverse=True,
+            ):
+                major = parsed[index].major_number
+                if kept.get(major, 0) < self.keep_latest_per_major:
+                    kept[major] = kept.get(major, 0) + 1
+                    protected.add(index)
+        return protected
+
+    def select(self, inventory, selection):
+        """Drop the protected versions from a selection of an inventory."""
+        filtered = {}
+        for package_id, rows in selection.items():
+            column = inventory.version_columns[package_id]
+            protected = self.protected(
+                [inventory.versions[version_id] for version_id in column]
+            )
+            rows = array("I", (row for row in rows if row not in protected))
+            if rows:
+                filtered[package_id] = rows
+        return filtered
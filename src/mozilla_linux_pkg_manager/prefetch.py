@@ -0,0 +1,42 @@
+import asyncio
+
+# Marks the end of the iterable in the queue of `prefetched`.
+DONE = object()
+
+
+async def prefetched(iterable, depth):
+    """Iterate over an async iterable, fetching up to `depth` items ahead.
+
+    A background task iterates over `iterable` into a queue of `depth` items,
+    so the next items (like the pages of a listing) are fetched while the
+    consumer is still busy with the current one. Exceptions raised by the
+    iterable are raised to the consumer once it gets to them. With a `depth`
+    of 0, the iterable is iterated over directly.
+    """
+    if not depth:
+        async for item in iterable:
+            yield item
+        return
+
+    queue = asyncio.Queue(depth)
+
+    async def fetch():
+        try:
+            async for item in iterable:
+                await queue.put((item, None))
+        except Exception as e:
+            await queue.put((DONE, e))
+        else:
+            await queue.put((DONE, None))
+
+    task = asyncio.create_task(fetch())
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is DONE:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        task.cancel()
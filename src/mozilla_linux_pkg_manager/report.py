@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+from mozilla_linux_pkg_manager.metrics import Histogram
+
+# Upper bounds in days of the age histogram buckets of expired versions.
+AGE_BUCKETS = (7, 30, 90, 180, 365, 730)
+TOP_PACKAGES = 10
+SAMPLE_SIZE = 10
+
+
+def format_sample(items, size=SAMPLE_SIZE):
+    """Join the first `size` of a list of strings, mentioning how many were left out."""
+    sample = ", ".join(items[:size])
+    if len(items) > size:
+        sample += f", ... ({len(items) - size} more)"
+    return sample
+
+
+def log_ages(counts, buckets=AGE_BUCKETS):
+    """Log the non-empty buckets of an age histogram's counts."""
+    lower = 0
+    for bound, count in zip((*buckets, None), counts):
+        if count:
+            label = f"{lower}-{bound} days" if bound else f"over {lower} days"
+            logging.info(f"  {label}: {count}")
+        lower = bound
+
+
+class ExpiryReport:
+    """Aggregated stats of the expired versions of a run.
+
+    Only bounded aggregates are kept: the number of expired versions of each
+    package and a histogram of their age in days. With `path`, every expired
+    version is also written to a JSON Lines artifact as soon as it's reported,
+    as a `{"package": ..., "version": ..., "create_time": ...}` record, so full
+    listings never have to be held in memory or formatted for the log.
+    """
+
+    def __init__(self, path=None, now=None):
+        self.now = now or time.time()
+        self.counts = Counter()
+        self.ages = Histogram(AGE_BUCKETS)
+        self.file = open(path, "w") if path else None
+
+    def fork(self):
+        """Return a report with aggregates of its own, writing to the same artifact."""
+        report = ExpiryReport(now=self.now)
+        report.file = self.file
+        return report
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+    def add(self, package, version, create_time):
+        self.counts[package] += 1
+        self.ages.observe((self.now - create_time) / 86400)
+        if self.file:
+            self.file.write(
+                json.dumps(
+                    {"package": package, "version": version, "create_time": create_time}
+                )
+                + "\n"
+            )
+
+    def add_selection(self, inventory, selection):
+        """Report the selected rows of a `VersionInventory`, by package id."""
+        for package_id, rows in selection.items():
+            package = inventory.packages[package_id]
+            version_column = inventory.version_columns[package_id]
+            create_time_column = inventory.create_time_columns[package_id]
+            for row in rows:
+                self.add(
+                    package,
+                    inventory.versions[version_column[row]],
+                    create_time_column[row],
+                )
+
+    def log(self, top=TOP_PACKAGES):
+        if not self.counts:
+            return
+        logging.info(
+            f"Top {min(top, len(self.counts))} of {len(self.counts)} packages by expired versions:"
+        )
+        for package, count in self.counts.most_common(top):
+            logging.info(f"  {os.path.basename(package)}: {count}")
+        logging.info("Expired versions by age:")
+        log_ages(self.ages.counts)
+        if self.file:
+            logging.info(f"Wrote every expired version to {self.file.name}.")
@@ -0,0 +1,111 @@
+import copy
+import itertools
+
+import google.auth
+from google.cloud import artifactregistry_v1
+
+from mozilla_linux_pkg_manager.limiter import AdaptiveLimiter
+from mozilla_linux_pkg_manager.metrics import Metrics
+
+
+class Session:
+    """Artifact Registry clients shared by every API call of a run."""
+
+    def __init__(
+        self,
+        channels=1,
+        keepalive_seconds=0,
+        max_concurrent_requests=0,
+        prefetch_pages=1,
+    ):
+        self.channels = channels
+        self.keepalive_seconds = keepalive_seconds
+        self.prefetch_pages = prefetch_pages
+        self.limiter = (
+            AdaptiveLimiter(max_concurrent_requests)
+            if max_concurrent_requests
+            else None
+        )
+        self.credentials = None
+        self.clients = []
+        self.filters_versions = True
+        self.orders_versions = True
+        self.metrics = Metrics()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(
+            channels=args.grpc_channels,
+            keepalive_seconds=args.grpc_keepalive_seconds,
+            max_concurrent_requests=args.max_concurrent_requests,
+            prefetch_pages=args.prefetch_pages,
+        )
+
+    def fork(self):
+        """Return a session with clients and a limiter of its own.
+
+        The fork shares the credentials and the metrics of this session, so
+        several parts of a run (like the regions of a clean-up) can each get
+        their own connections and concurrency budget.
+        """
+        session = copy.copy(self)
+        session.clients = []
+        if self.limiter:
+            session.limiter = AdaptiveLimiter(self.limiter.maximum)
+        return session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def client(self):
+        if not self.clients:
+            self.clients = [self.create_client() for _ in range(self.channels)]
+            self.next_client = itertools.cycle(self.clients)
+        return next(self.next_client)
+
+    def channel_options(self):
+        options = []
+        if self.channels > 1:
+            options.append(("grpc.use_local_subchannel_pool", 1))
+        if self.keepalive_seconds:
+            options += [
+                ("grpc.keepalive_time_ms", self.keepalive_seconds * 1000),
+                ("grpc.keepalive_timeout_ms", 20 * 1000),
+                ("grpc.keepalive_permit_without_calls", 1),
+                ("grpc.http2.max_pings_without_data", 0),
+            ]
+        return options
+
+    def create_client(self):
+        options = self.channel_options()
+        if not options:
+            return artifactregistry_v1.ArtifactRegistryAsyncClient()
+
+        transport_class = (
+            artifactregistry_v1.ArtifactRegistryAsyncClient.get_transport_class(
+                "grpc_asyncio"
+            )
+        )
+        if self.credentials is None:
+            self.credentials, _ = google.auth.default(
+                scopes=transport_class.AUTH_SCOPES
+            )
+        channel = transport_class.create_channel(
+            credentials=self.credentials,
+            options=[
+                ("grpc.max_send_message_length", -1),
+                ("grpc.max_receive_message_length", -1),
+                *options,
+            ],
+        )
+        return artifactregistry_v1.ArtifactRegistryAsyncClient(
+            transport=transport_class(channel=channel)
+        )
+
+    async def close(self):
+        for client in self.clients:
+            await client.transport.close()
+        self.clients = []
@@ -0,0 +1,198 @@
+"""Columnar snapshot files of every version of some repositories.
+
+A snapshot holds a repository, package, version and create_time row per version,
+written by the `inventory` command and read back without calling the API. The
+file is a block of two fixed-width columns per package, the ids of its version
+names (`array("I")`) and their creation time in epoch seconds (`array("q")`),
+sorted by creation time. A JSON footer indexes the blocks, with the offset and
+row count of each package, along with the interned repository and version
+names. It's followed by its length and the magic bytes the file starts with.
+"""
+
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+
+from mozilla_linux_pkg_manager.report import AGE_BUCKETS, TOP_PACKAGES, log_ages
+
+MAGIC = b"MLPMSNP1"
+FOOTER_LENGTH = struct.Struct("<Q")
+
+
+class SnapshotWriter:
+    """Write a snapshot, one package at a time.
+
+    Only the package being written and the interned names are held in memory,
+    so memory doesn't grow with the number of versions of the snapshot. The
+    snapshot is written to a temporary file next to `path`, which only replaces
+    `path` once it's complete.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(f"{path}.tmp", "wb")
+        self.file.write(MAGIC)
+        self.repositories = []
+        self.repository_ids = {}
+        self.packages = []
+        self.versions = []
+        self.version_ids = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_package(self, name, versions):
+        """Write the `(version, create_time)` of a package, by its resource name."""
+        repository, _, package = name.partition("/packages/")
+        repository_id = self.repository_ids.setdefault(
+            repository, len(self.repositories)
+        )
+        if repository_id == len(self.repositories):
+            self.repositories.append(repository)
+        versions = sorted(versions, key=itemgetter(1))
+        version_column = array("I")
+        for version, _ in versions:
+            version_id = self.version_ids.get(version)
+            if version_id is None:
+                version_id = self.version_ids[version] = len(self.versions)
+                self.versions.append(version)
+            version_column.append(version_id)
+        create_time_column = array(
+            "q", (int(create_time) for _, create_time in versions)
+        )
+        self.packages.append((repository_id, package, self.file.tell(), len(versions)))
+        version_column.tofile(self.file)
+        create_time_column.tofile(self.file)
+
+    def close(self):
+        footer = json.dumps(
+            {
+                "byteorder": sys.byteorder,
+                "repositories": self.repositories,
+                "packages": self.packages,
+                "versions": self.versions,
+            }
+        ).encode()
+        self.file.write(footer)
+        self.file.write(FOOTER_LENGTH.pack(len(footer)))
+        self.file.write(MAGIC)
+        self.file.close()
+        os.replace(self.file.name, self.path)
+
+    def abort(self):
+        """Discard the snapshot, leaving any previous one at `path` alone."""
+        self.file.close()
+        os.unlink(self.file.name)
+
+
+class Snapshot:
+    """Read a snapshot back, one package column at a time.
+
+    Counts come from the index without reading any column. Since columns are
+    sorted by creation time, age histograms are a bisection per bucket bound
+    rather than a pass over every row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} isn't a snapshot file")
+            f.seek(-len(MAGIC) - FOOTER_LENGTH.size, os.SEEK_END)
+            (length,) = FOOTER_LENGTH.unpack(f.read(FOOTER_LENGTH.size))
+            f.seek(-len(MAGIC) - FOOTER_LENGTH.size - length, os.SEEK_END)
+            footer = json.loads(f.read(length))
+        self.swap = footer["byteorder"] != sys.byteorder
+        self.repositories = footer["repositories"]
+        self.packages = footer["packages"]
+        self.versions = footer["versions"]
+
+    def __len__(self):
+        return sum(rows for _, _, _, rows in self.packages)
+
+    def package_name(self, index):
+        repository_id, package, _, _ = self.packages[index]
+        return f"{self.repositories[repository_id]}/packages/{package}"
+
+    def read_columns(self, index):
+        """Return the version id and create_time columns of a package."""
+        _, _, offset, rows = self.packages[index]
+        version_column = array("I")
+        create_time_column = array("q")
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            version_column.fromfile(f, rows)
+            create_time_column.fromfile(f, rows)
+        if self.swap:
+            version_column.byteswap()
+            create_time_column.byteswap()
+        return version_column, create_time_column
+
+    def rows(self):
+        """Yield a `(repository, package, version, create_time)` tuple per version."""
+        for index, (repository_id, package, _, _) in enumerate(self.packages):
+            version_column, create_time_column = self.read_columns(index)
+            repository = self.repositories[repository_id]
+            for version_id, create_time in zip(version_column, create_time_column):
+                yield repository, package, self.versions[version_id], create_time
+
+    def counts(self):
+        """Map the name of each package to its number of versions."""
+        return Counter(
+            {
+                self.package_name(index): rows
+                for index, (_, _, _, rows) in enumerate(self.packages)
+            }
+        )
+
+    def age_counts(self, index, now=None, buckets=AGE_BUCKETS):
+        """Count the versions of a package per age bucket, like `Histogram.counts`."""
+        now = now or time.time()
+        _, create_time_column = self.read_columns(index)
+        # Versions at most `bound` days old were created at or after
+        # `now - bound` days, the end of the sorted column.
+        younger = [
+            len(create_time_column)
+            - bisect_left(create_time_column, now - bound * 86400)
+            for bound in buckets
+        ]
+        return [
+            count - previous
+            for count, previous in zip(
+                (*younger, len(create_time_column)), (0, *younger)
+            )
+        ]
+
+    def age_histograms(self, now=None, buckets=AGE_BUCKETS):
+        """Map the name of each package to its `age_counts`."""
+        now = now or time.time()
+        return {
+            self.package_name(index): self.age_counts(index, now, buckets)
+            for index in range(len(self.packages))
+        }
+
+    def log(self, now=None, top=TOP_PACKAGES):
+        counts = self.counts()
+        logging.info(
+            f"{self.path} has {sum(counts.values())} versions of {len(counts)} packages."
+        )
+        if not counts:
+            return
+        logging.info(f"Top {min(top, len(counts))} packages by versions:")
+        for package, count in counts.most_common(top):
+            logging.info(f"  {os.path.basename(package)}: {count}")
+        logging.info("Versions by age:")
+        log_ages([sum(bucket) for bucket in zip(*self.age_histograms(now).values())])
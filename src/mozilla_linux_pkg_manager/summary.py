@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+
+from mozilla_linux_pkg_manager.report import format_sample
+
+
+@dataclass
+class CleanUpSummary:
+    """Totals of a clean-up run, which the runs of several shards add up to."""
+
+    package: str = ""
+    dry_run: bool = False
+    version_count: int = 0
+    expired_packages: int = 0
+    expired_count: int = 0
+    unique_expired_versions: list = field(default_factory=list)
+    succeeded_batches: int = 0
+    failed_batches: list = field(default_factory=list)
+    deleted_versions: int = 0
+    delete_seconds: float = 0
+    server_filtered: bool = False
+    leftover_versions: int = 0
+
+    def add_deletions(self, scheduler):
+        self.succeeded_batches += scheduler.succeeded_batches
+        self.failed_batches.extend(
+            (package, list(names), str(error))
+            for package, names, error in scheduler.failed_batches
+        )
+        self.deleted_versions += scheduler.deleted_versions
+        self.leftover_versions += scheduler.leftover_versions
+        self.delete_seconds += scheduler.end - scheduler.start
+
+    @classmethod
+    def merge(cls, summaries):
+        """Add up the summaries of shards that ran side by side."""
+        total = cls()
+        unique_expired_versions = set()
+        for summary in summaries:
+            total.package = summary.package
+            total.dry_run = summary.dry_run
+            total.version_count += summary.version_count
+            total.expired_packages += summary.expired_packages
+            total.expired_count += summary.expired_count
+            unique_expired_versions.update(summary.unique_expired_versions)
+            total.succeeded_batches += summary.succeeded_batches
+            total.failed_batches.extend(summary.failed_batches)
+            total.deleted_versions += summary.deleted_versions
+            total.delete_seconds = max(total.delete_seconds, summary.delete_seconds)
+            total.server_filtered = total.server_filtered or summary.server_filtered
+            total.leftover_versions += summary.leftover_versions
+        total.unique_expired_versions = sorted(unique_expired_versions)
+        return total
+
+    def log(self):
+        if not self.expired_packages:
+            logging.info("No expired package versions found, nothing to do!")
+            return
+        log_scan_summary(
+            self.expired_packages,
+            self.expired_count,
+            self.unique_expired_versions,
+            self.version_count,
+            self.package,
+            self.server_filtered,
+        )
+        if self.succeeded_batches or self.failed_batches:
+            log_delete_summary(
+                self.delete_seconds,
+                self.succeeded_batches,
+                self.failed_batches,
+                self.deleted_versions,
+                self.dry_run,
+            )
+        if self.leftover_versions:
+            log_leftovers(self.leftover_versions)
+
+
+def log_scan_summary(
+    expired_packages,
+    expired_count,
+    unique_expired_versions,
+    version_count,
+    package,
+    server_filtered=False,
+):
+    logging.info(f"Found {expired_packages} packages matching {package}")
+    logging.info(
+        f"Found unique expired versions: {format_sample(unique_expired_versions)}"
+    )
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(
+            f"unique_expired_versions = {json.dumps(list(unique_expired_versions), indent=4)}"
+        )
+    logging.info(f"There's a total of {expired_count} expired versions to clean-up!")
+    logging.info(
+        f"Out of those expired versions, there are {len(unique_expired_versions)} unique versions across all packages."
+    )
+    logging.info(
+        f"Fetched {version_count} versions{' filtered server-side' if server_filtered else ''}, "
+        f"kept {expired_count} of them to clean-up."
+    )
+    if not server_filtered:
+        logging.info(
+            f"There's a total of {version_count} versions. After clean-up, there will be {version_count - expired_count} versions left."
+        )
+
+
+def log_delete_summary(
+    elapsed, succeeded_batches, failed_batches, deleted_versions, dry_run
+):
+    logging.info(
+        f"Done. Ran delete version requests for {int(elapsed)} seconds (that's about ~{int(elapsed) // 60} minutes.)"
+    )
+    logging.info(
+        f"{succeeded_batches} batches succeeded and {len(failed_batches)} failed. "
+        f"{'Validated' if dry_run else 'Deleted'} {deleted_versions} versions, "
+        f"that's {deleted_versions / max(elapsed, 1e-9):.1f} versions per second."
+    )
+    for package, names, error in failed_batches:
+        logging.error(
+            f"Failed batch of {os.path.basename(package)}: {', '.join(os.path.basename(name) for name in names)} ({error})"
+        )
+
+
+def log_leftovers(leftover_versions, leftover_packages=None):
+    of_packages = f" of {leftover_packages} packages" if leftover_packages else ""
+    logging.warning(
+        f"Ran out of time, left {leftover_versions} expired versions{of_packages} for the next run."
+    )
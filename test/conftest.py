@@ -0,0 +1,27 @@
+from mozilla_linux_pkg_manager.main import get_parser
+
+
+def delete_args(*options):
+    """Parse the deletion options shared by every command deleting versions."""
+    return get_parser().parse_args(["apply", "--plan", "plan.jsonl", *options])
+
+
+def clean_up_args(*options):
+    """Parse the options of a clean-up of the firefox packages of `mozilla` in `us`.
+
+    Versions are kept for a day, unless `options` say otherwise.
+    """
+    return get_parser().parse_args(
+        [
+            "clean-up",
+            "--package",
+            "^firefox",
+            "--repository",
+            "mozilla",
+            "--region",
+            "us",
+            "--retention-days",
+            "1",
+            *options,
+        ]
+    )
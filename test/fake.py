@@ -0,0 +1,304 @@
+"""An in-process fake of the Artifact Registry API, for tests and benchmarks.
+
+`FakeArtifactRegistry` implements the subset of `ArtifactRegistryAsyncClient`
+used by `mozilla_linux_pkg_manager` on top of synthetic repositories. Versions
+are generated on demand rather than stored, so repositories with millions of
+versions are cheap to set up. Page and long-running operation latencies, as well
+as the rate of `TooManyRequests`/`ServiceUnavailable` errors, are configurable.
+Like the real service, version listings can be ordered newest first but can't
+be filtered by creation time, unless `filters_versions` is set. Without
+`orders_versions`, the order of version listings is silently ignored.
+"""
+
+import asyncio
+import os
+import random
+import re
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+from google.api_core import exceptions as api_exceptions
+from google.cloud import artifactregistry_v1
+
+from mozilla_linux_pkg_manager.session import Session
+
+
+class FakePackage:
+    """A package whose versions are `1.0.<index>`, one created every `interval`."""
+
+    def __init__(self, name, version_count, newest, interval):
+        self.name = name
+        self.version_count = version_count
+        self.newest = newest
+        self.interval = interval
+        self.deleted = set()
+
+    def create_time(self, index):
+        return self.newest - (self.version_count - 1 - index) * self.interval
+
+    def index(self, version_name):
+        prefix = f"{self.name}/versions/1.0."
+        if not version_name.startswith(prefix):
+            return None
+        try:
+            index = int(version_name[len(prefix) :])
+        except ValueError:
+            return None
+        if 0 <= index < self.version_count and index not in self.deleted:
+            return index
+        return None
+
+    def version(self, index):
+        return artifactregistry_v1.Version(
+            name=f"{self.name}/versions/1.0.{index}",
+            create_time=self.create_time(index),
+        )
+
+    def publish(self, count):
+        """Create `count` new versions, one every `interval` after the newest."""
+        self.version_count += count
+        self.newest += count * self.interval
+
+    def versions(self, created_before=None, newest_first=False):
+        indices = range(self.version_count)
+        if newest_first:
+            indices = reversed(indices)
+        for index in indices:
+            if index in self.deleted:
+                continue
+            if created_before and self.create_time(index) >= created_before:
+                if newest_first:
+                    continue
+                # Versions are sorted by creation time.
+                return
+            yield self.version(index)
+
+
+class FakePager:
+    """Async pager over results, fetching one page at a time.
+
+    Like the real pagers, the first page comes with the list call itself and
+    each of the next ones costs another call.
+    """
+
+    def __init__(self, registry, field, items, page_size, retry):
+        self.registry = registry
+        self.field = field
+        self.items = items
+        self.page_size = page_size or 1000
+        self.retry = retry
+
+    @property
+    async def pages(self):
+        items = iter(self.items)
+        first = True
+        while True:
+            if not first:
+                await self.registry.call("page", lambda: None, self.retry)
+            first = False
+            page = []
+            for item in items:
+                page.append(item)
+                if len(page) == self.page_size:
+                    break
+            yield SimpleNamespace(**{self.field: page})
+            if len(page) < self.page_size:
+                return
+
+    async def __aiter__(self):
+        async for page in self.pages:
+            for item in getattr(page, self.field):
+                yield item
+
+
+class FakeOperation:
+    def __init__(self, registry, request):
+        self.registry = registry
+        self.request = request
+
+    async def result(self):
+        await asyncio.sleep(self.registry.lro_latency)
+        packages = self.registry.packages
+        indices = [
+            packages[self.request.parent].index(name) for name in self.request.names
+        ]
+        if None in indices:
+            raise api_exceptions.NotFound(
+                f"Some versions of {self.request.parent} don't exist"
+            )
+        if not self.request.validate_only:
+            packages[self.request.parent].deleted.update(indices)
+            self.registry.deleted_versions += len(indices)
+
+
+class FakeArtifactRegistry:
+    """Stand-in for `ArtifactRegistryAsyncClient` over synthetic repositories.
+
+    `repositories` maps repository names to `{package_name: version_count}`.
+    Repositories are in `region`, unless named `region/repository`.
+    Versions of each package are created every `interval`, the newest of them at
+    `newest`.
+    """
+
+    def __init__(
+        self,
+        repositories,
+        project="fake-project",
+        region="us",
+        newest=None,
+        interval=timedelta(hours=1),
+        page_latency=0,
+        lro_latency=0,
+        error_rate=0,
+        seed=0,
+        filters_versions=False,
+        orders_versions=True,
+    ):
+        self.newest = newest or datetime.now(UTC)
+        self.page_latency = page_latency
+        self.lro_latency = lro_latency
+        self.error_rate = error_rate
+        self.filters_versions = filters_versions
+        self.orders_versions = orders_versions
+        self.fetched_versions = 0
+        self.random = random.Random(seed)
+        self.calls = {}
+        self.deleted_versions = 0
+        self.repositories = {}
+        self.packages = {}
+        for repository, packages in repositories.items():
+            repository_region, _, repository = repository.rpartition("/")
+            repository_name = (
+                f"projects/{project}/locations/{repository_region or region}"
+                f"/repositories/{repository}"
+            )
+            self.repositories[repository_name] = []
+            for package, version_count in packages.items():
+                package_name = f"{repository_name}/packages/{package}"
+                self.repositories[repository_name].append(package_name)
+                self.packages[package_name] = FakePackage(
+                    package_name, version_count, self.newest, interval
+                )
+        self.transport = self
+
+    @classmethod
+    def synthetic(cls, versions, packages=100, repository="mozilla", **kwargs):
+        """Spread `versions` evenly over `packages` l10n packages of one repository."""
+        per_package, remainder = divmod(versions, packages)
+        return cls(
+            {
+                repository: {
+                    f"firefox-l10n-{package}": per_package + (package < remainder)
+                    for package in range(packages)
+                }
+            },
+            **kwargs,
+        )
+
+    def session(self, **kwargs):
+        """Return a `Session` whose clients are this registry."""
+        return FakeSession(self, **kwargs)
+
+    async def rpc(self, method):
+        """Account for a call, waiting and failing like the real service would."""
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method in ("list_packages", "list_versions", "page") and self.page_latency:
+            await asyncio.sleep(self.page_latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise self.random.choice(
+                (api_exceptions.TooManyRequests, api_exceptions.ServiceUnavailable)
+            )(f"Injected error in {method}")
+
+    async def call(self, method, function, retry):
+        async def attempt():
+            await self.rpc(method)
+            return function()
+
+        if retry:
+            return await retry(attempt)()
+        return await attempt()
+
+    async def get_repository(self, request, retry=None, **kwargs):
+        def get():
+            if request.name not in self.repositories:
+                raise api_exceptions.NotFound(f"Repository {request.name} not found")
+            return artifactregistry_v1.Repository(name=request.name)
+
+        return await self.call("get_repository", get, retry)
+
+    async def list_packages(self, request, retry=None, **kwargs):
+        def list_():
+            return FakePager(
+                self,
+                "packages",
+                [
+                    artifactregistry_v1.Package(name=name)
+                    for name in self.repositories.get(request.parent, [])
+                ],
+                request.page_size,
+                retry,
+            )
+
+        return await self.call("list_packages", list_, retry)
+
+    def fetched(self, versions):
+        for version in versions:
+            self.fetched_versions += 1
+            yield version
+
+    async def list_versions(self, request, retry=None, **kwargs):
+        def list_():
+            created_before = None
+            if request.filter:
+                match = re.fullmatch(r'create_time < "(.+)"', request.filter)
+                if not (self.filters_versions and match):
+                    raise api_exceptions.InvalidArgument(
+                        f"Invalid filter: {request.filter}"
+                    )
+                created_before = datetime.fromisoformat(match.group(1))
+            if request.order_by not in ("", "create_time desc"):
+                raise api_exceptions.InvalidArgument(
+                    f"Invalid order_by: {request.order_by}"
+                )
+            versions = self.packages[request.parent].versions(
+                created_before,
+                newest_first=bool(request.order_by) and self.orders_versions,
+            )
+            return FakePager(
+                self,
+                "versions",
+                self.fetched(versions),
+                request.page_size,
+                retry,
+            )
+
+        return await self.call("list_versions", list_, retry)
+
+    async def get_version(self, request, retry=None, **kwargs):
+        def get():
+            package = self.packages.get(os.path.dirname(os.path.dirname(request.name)))
+            index = package.index(request.name) if package else None
+            if index is None:
+                raise api_exceptions.NotFound(f"Version {request.name} not found")
+            return package.version(index)
+
+        return await self.call("get_version", get, retry)
+
+    async def batch_delete_versions(self, request, retry=None, **kwargs):
+        return await self.call(
+            "batch_delete_versions", lambda: FakeOperation(self, request), retry
+        )
+
+    async def close(self):
+        pass
+
+
+class FakeSession(Session):
+    """A `Session` handing out a `FakeArtifactRegistry` instead of real clients."""
+
+    def __init__(self, registry, **kwargs):
+        super().__init__(**kwargs)
+        self.registry = registry
+
+    def create_client(self):
+        return self.registry
@@ -0,0 +1,104 @@
+import sqlite3
+
+from mozilla_linux_pkg_manager.cache import InventoryCache
+
+PACKAGE = "projects/test-project/locations/us/repositories/my-repo/packages/firefox"
+
+
+def make_cache(tmp_path, ttl=3600, max_age=86400):
+    return InventoryCache(str(tmp_path / "inventory.sqlite3"), ttl, max_age)
+
+
+def test_inventory_cache_versions(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.replace(
+        PACKAGE,
+        [
+            (f"{PACKAGE}/versions/42.0", 100),
+            (f"{PACKAGE}/versions/41.0", 50),
+            (f"{PACKAGE}/versions/43.0", 200),
+        ],
+        now=1000,
+    )
+
+    assert cache.versions(PACKAGE) == [
+        (f"{PACKAGE}/versions/41.0", 50),
+        (f"{PACKAGE}/versions/42.0", 100),
+        (f"{PACKAGE}/versions/43.0", 200),
+    ]
+
+
+def test_inventory_cache_ttl(tmp_path):
+    cache = make_cache(tmp_path, ttl=3600)
+    assert not cache.is_fresh(PACKAGE, now=1000)
+
+    cache.replace(PACKAGE, [], now=1000)
+    assert cache.is_fresh(PACKAGE, now=1000 + 3599)
+    assert not cache.is_fresh(PACKAGE, now=1000 + 3600)
+
+
+def test_inventory_cache_persists(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.replace(PACKAGE, [(f"{PACKAGE}/versions/42.0", 100)], now=1000)
+    cache.close()
+
+    assert len(make_cache(tmp_path).versions(PACKAGE)) == 1
+
+
+def test_inventory_cache_remove(tmp_path):
+    cache = make_cache(tmp_path)
+    versions = [(f"{PACKAGE}/versions/42.0.{i}", i) for i in range(3)]
+    cache.replace(PACKAGE, versions, now=1000)
+    cache.remove(PACKAGE, [f"{PACKAGE}/versions/42.0.0"])
+    assert len(cache.versions(PACKAGE)) == 2
+
+    # A listing that started before the deletion doesn't bring it back.
+    cache.replace(PACKAGE, versions, now=1000)
+    assert len(cache.versions(PACKAGE)) == 2
+
+
+def test_inventory_cache_evict(tmp_path):
+    cache = make_cache(tmp_path, max_age=100)
+    cache.replace(PACKAGE, [(f"{PACKAGE}/versions/42.0", 1)], now=1000)
+    cache.replace(f"{PACKAGE}-beta", [(f"{PACKAGE}-beta/versions/42.0b1", 1)], now=1050)
+
+    assert cache.evict(now=1120) == 1
+    assert len(cache.versions(PACKAGE)) == 0
+    assert not cache.is_fresh(PACKAGE, now=1120)
+    assert len(cache.versions(f"{PACKAGE}-beta")) == 1
+
+
+def test_inventory_cache_marks(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.marks(PACKAGE) is None
+
+    cache.replace(
+        PACKAGE, [(f"{PACKAGE}/versions/42.0.{i}", 100 + i) for i in range(3)]
+    )
+    assert cache.marks(PACKAGE) == (102, 100)
+
+    # New versions raise the high-water mark, removed ones the low-water mark.
+    cache.add(PACKAGE, [(f"{PACKAGE}/versions/42.0.3", 103)])
+    cache.remove(PACKAGE, [f"{PACKAGE}/versions/42.0.0"])
+    assert cache.marks(PACKAGE) == (103, 101)
+
+    # Deleting the newest version doesn't lower the high-water mark.
+    cache.remove(PACKAGE, [f"{PACKAGE}/versions/42.0.3"])
+    cache.add(PACKAGE, [])
+    assert cache.marks(PACKAGE) == (103, 101)
+    assert len(cache.versions(PACKAGE)) == 2
+
+
+def test_inventory_cache_schema_version(tmp_path):
+    path = tmp_path / "inventory.sqlite3"
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE packages (name TEXT PRIMARY KEY, refreshed_at INTEGER)")
+    db.execute("INSERT INTO packages VALUES (?, ?)", (PACKAGE, 1000))
+    db.commit()
+    db.close()
+
+    # Caches of an older schema are dropped.
+    cache = make_cache(tmp_path)
+    assert not cache.is_fresh(PACKAGE, now=1000)
+    cache.replace(PACKAGE, [(f"{PACKAGE}/versions/42.0", 100)])
+    assert cache.marks(PACKAGE) == (100, 100)
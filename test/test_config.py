@@ -0,0 +1,173 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from conftest import clean_up_args
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import get_parser, scan_and_clean_up
+from mozilla_linux_pkg_manager.config import (
+    Rule,
+    RuleMatcher,
+    load_rules,
+    rules_from_args,
+    split_rules_by_region,
+)
+
+NOW = datetime(2024, 8, 1, tzinfo=UTC)
+CONFIG = """
+region: us
+rules:
+  - repository: mozilla
+    package: "^firefox-nightly(-l10n-.+)?$"
+    retention-days: 1
+  - repository: [mozilla, mozilla-esr]
+    package: "^firefox(-l10n-.+)?$"
+    retention-days: 3
+    keep-esr: true
+  - repository: mozilla
+    package: "^firefox-devedition$"
+    region: europe-west1
+    retention-days: 60
+"""
+
+
+def write_config(tmp_path, config):
+    path = tmp_path / "policies.yaml"
+    path.write_text(config)
+    return str(path)
+
+
+def test_load_rules(tmp_path):
+    rules = load_rules(write_config(tmp_path, CONFIG), NOW)
+
+    assert [(rule.region, rule.repository, rule.retention_days) for rule in rules] == [
+        ("us", "mozilla", 1),
+        ("us", "mozilla", 3),
+        ("us", "mozilla-esr", 3),
+        ("europe-west1", "mozilla", 60),
+    ]
+    assert rules[0].cutoff == (NOW - timedelta(days=1)).timestamp()
+    assert rules[0].policy is None
+    assert rules[1].policy.keep_esr
+
+
+@pytest.mark.parametrize(
+    "config,error",
+    [
+        ("rules: {}", "doesn't have a list of rules"),
+        (
+            "rules: [{repository: mozilla, package: x}]",
+            "missing: retention-days, region",
+        ),
+        (
+            "{region: us, rules: [{repository: mozilla, package: x, retention-days: 1, days: 2}]}",
+            "unknown keys: days",
+        ),
+        (
+            "{region: us, rules: [{repository: mozilla, package: '(', retention-days: 1}]}",
+            "invalid regex",
+        ),
+        (
+            "{region: us, rules: [{repository: mozilla, package: x, retention-days: a}]}",
+            "non-integer",
+        ),
+    ],
+)
+def test_load_rules_invalid(tmp_path, config, error):
+    with pytest.raises(ValueError, match=error):
+        load_rules(write_config(tmp_path, config), NOW)
+
+
+def test_rules_from_args_regions():
+    args = clean_up_args(
+        "--repository", "mozilla", "asia/mozilla-esr", "--region", "us", "europe"
+    )
+
+    rules = rules_from_args(args, NOW)
+
+    assert [(rule.region, rule.repository) for rule in rules] == [
+        ("us", "mozilla"),
+        ("europe", "mozilla"),
+        ("asia", "mozilla-esr"),
+    ]
+    assert list(split_rules_by_region(rules)) == ["us", "europe", "asia"]
+
+
+def test_rule_matcher(tmp_path):
+    rules = load_rules(write_config(tmp_path, CONFIG), NOW)
+    matcher = RuleMatcher([rule for rule in rules if rule.repository == "mozilla"])
+
+    assert matcher.match("firefox-nightly-l10n-fr") is rules[0]
+    assert matcher.match("firefox-l10n-fr") is rules[1]
+    assert matcher.match("firefox") is rules[1]
+    assert matcher.match("firefox-devedition") is rules[3]
+    assert matcher.match("thunderbird") is None
+
+
+@pytest.mark.parametrize(
+    "packages",
+    [
+        ["(?i)FIREFOX"],
+        [r"(f)i\1?refox"],
+        ["^thunderbird$", "(?i)FIREFOX"],
+        ["^thunderbird$", r"(f)i\1?refox"],
+    ],
+)
+def test_rule_matcher_regexes(packages):
+    rules = [
+        Rule(
+            region="us",
+            repository="mozilla",
+            package=package,
+            retention_days=1,
+            cutoff=NOW.timestamp(),
+        )
+        for package in packages
+    ]
+    matcher = RuleMatcher(rules)
+
+    assert matcher.match("firefox") is rules[-1]
+    assert matcher.match("thunderbird") is (rules[0] if len(rules) > 1 else None)
+    assert matcher.match("seamonkey") is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [True, False])
+async def test_clean_up_config(tmp_path, monkeypatch, stream):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {
+            "mozilla": {"firefox": 100, "firefox-nightly": 100, "thunderbird": 100},
+            "mozilla-esr": {"firefox-l10n-fr": 100},
+        },
+        interval=timedelta(hours=1),
+    )
+    config = """
+    region: us
+    rules:
+      - {repository: mozilla, package: "^firefox-nightly$", retention-days: 1}
+      - {repository: [mozilla, mozilla-esr], package: "^firefox", retention-days: 2}
+    """
+    args = get_parser().parse_args(
+        ["clean-up", "--config", write_config(tmp_path, config)]
+        + (["--stream"] if stream else [])
+    )
+
+    async with registry.session() as session:
+        summary = await scan_and_clean_up(args, session, cache=None)
+
+    # Each repository was listed once, whatever the number of rules.
+    assert registry.calls["list_packages"] == 2
+    assert registry.calls["list_versions"] == 3
+    left = {
+        name.rsplit("/", 1)[1]: len(list(package.versions()))
+        for name, package in registry.packages.items()
+    }
+    assert left == {
+        "firefox": 48,
+        "firefox-nightly": 24,
+        "thunderbird": 100,
+        "firefox-l10n-fr": 48,
+    }
+    assert summary.expired_count == 52 + 76 + 52
+    assert summary.package == f"the rules of {args.config}"
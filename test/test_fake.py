@@ -0,0 +1,373 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from conftest import clean_up_args
+from fake import FakeArtifactRegistry
+from google.api_core import exceptions as api_exceptions
+from google.cloud import artifactregistry_v1
+
+from mozilla_linux_pkg_manager.cache import InventoryCache
+from mozilla_linux_pkg_manager.cli import (
+    VERSIONS_FIELD_MASK,
+    clean_up_regions,
+    list_versions,
+    scan_and_clean_up,
+)
+from mozilla_linux_pkg_manager.config import rules_from_args
+from mozilla_linux_pkg_manager.report import ExpiryReport
+from mozilla_linux_pkg_manager.session import Session
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [True, False])
+async def test_clean_up_fake_registry(stream, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 48, "firefox-l10n-fr": 1048, "thunderbird": 48}},
+        interval=timedelta(hours=1),
+    )
+    args = clean_up_args(
+        "--scan-concurrency",
+        "2",
+        "--delete-concurrency",
+        "4",
+        *(["--stream"] if stream else []),
+    )
+
+    async with registry.session() as session:
+        await scan_and_clean_up(args, session, cache=None)
+
+    # Everything older than 24 hours is gone, except for the unmatched package.
+    assert registry.deleted_versions == 24 + 1024
+    packages = registry.packages
+    prefix = "projects/fake-project/locations/us/repositories/mozilla/packages"
+    assert len(list(packages[f"{prefix}/firefox"].versions())) == 24
+    assert len(list(packages[f"{prefix}/firefox-l10n-fr"].versions())) == 24
+    assert len(list(packages[f"{prefix}/thunderbird"].versions())) == 48
+    # The l10n package needed a second page.
+    assert registry.calls["page"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fake_registry_errors():
+    registry = FakeArtifactRegistry({"mozilla": {"firefox": 1}}, error_rate=1)
+    request = artifactregistry_v1.GetRepositoryRequest(
+        name="projects/fake-project/locations/us/repositories/mozilla"
+    )
+
+    with pytest.raises(
+        (api_exceptions.TooManyRequests, api_exceptions.ServiceUnavailable)
+    ):
+        await registry.get_repository(request=request)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filters_versions", [True, False])
+@pytest.mark.parametrize("stream", [True, False])
+async def test_clean_up_server_filter(filters_versions, stream, monkeypatch, caplog):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 48, "firefox-l10n-fr": 1048}},
+        interval=timedelta(hours=1),
+        filters_versions=filters_versions,
+    )
+    args = clean_up_args("--server-filter", *(["--stream"] if stream else []))
+
+    with caplog.at_level("INFO"):
+        async with registry.session() as session:
+            summary = await scan_and_clean_up(args, session, cache=None)
+
+    assert registry.deleted_versions == summary.expired_count == 24 + 1024
+    assert summary.server_filtered is filters_versions
+    if filters_versions:
+        assert registry.fetched_versions == 24 + 1024
+        assert registry.calls["list_versions"] == 2
+        assert "filtered server-side, kept 1048 of them" in caplog.text
+    else:
+        assert registry.fetched_versions == 48 + 1048
+        # The listing was only tried with a filter once.
+        assert registry.calls["list_versions"] == 3
+        assert "filtering them client-side instead" in caplog.text
+        assert "Fetched 1096 versions, kept 1048 of them" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_list_versions_filter():
+    registry = FakeArtifactRegistry({"mozilla": {"firefox": 1}}, filters_versions=True)
+    session = registry.session()
+    package = artifactregistry_v1.Package(
+        name="projects/fake-project/locations/us/repositories/mozilla/packages/firefox"
+    )
+
+    with patch.object(
+        registry, "list_versions", wraps=registry.list_versions
+    ) as mock_list_versions:
+        await list_versions(package, session=session, created_before=1722470400)
+
+    kwargs = mock_list_versions.call_args.kwargs
+    assert kwargs["request"].filter == 'create_time < "2024-08-01T00:00:00Z"'
+    assert kwargs["request"].view == artifactregistry_v1.VersionView.BASIC
+    assert kwargs["metadata"] == VERSIONS_FIELD_MASK
+
+    # Without a filter, there's no fallback for a server refusing the mask.
+    with patch.object(
+        registry, "list_versions", wraps=registry.list_versions
+    ) as mock_list_versions:
+        await list_versions(package, session=session)
+
+    assert mock_list_versions.call_args.kwargs["metadata"] == ()
+
+
+@pytest.mark.asyncio
+async def test_clean_up_incremental(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 2200}}, interval=timedelta(minutes=1)
+    )
+    package = registry.packages[
+        "projects/fake-project/locations/us/repositories/mozilla/packages/firefox"
+    ]
+    # Never fresh, so every run refreshes the cache.
+    cache = InventoryCache(str(tmp_path / "inventory.sqlite3"), ttl=0, max_age=86400)
+
+    def parse_args(retention_days):
+        return clean_up_args(
+            "--package", "^firefox$", "--retention-days", str(retention_days)
+        )
+
+    async with registry.session() as session:
+        await scan_and_clean_up(parse_args(2), session, cache)
+    assert registry.deleted_versions == 0
+    assert registry.fetched_versions == 2200
+    assert registry.calls["page"] == 2
+
+    package.publish(10)
+    async with registry.session() as session:
+        summary = await scan_and_clean_up(parse_args(1), session, cache)
+
+    # Only the first page was listed, newest first, up to the high-water mark.
+    assert registry.calls["list_versions"] == 2
+    assert registry.calls["page"] == 2
+    assert registry.fetched_versions == 2200 + 1000
+    assert summary.version_count == 2210
+    # The new versions were published after the start of the run.
+    kept = 24 * 60 + 10
+    assert registry.deleted_versions == summary.expired_count == 2210 - kept
+    assert len(cache.versions(package.name)) == kept
+    assert len(list(package.versions())) == kept
+
+
+@pytest.mark.asyncio
+async def test_clean_up_incremental_unordered(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    # The server accepts order_by but lists versions oldest first.
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 48}},
+        interval=timedelta(hours=1),
+        orders_versions=False,
+    )
+    package = registry.packages[
+        "projects/fake-project/locations/us/repositories/mozilla/packages/firefox"
+    ]
+    cache = InventoryCache(str(tmp_path / "inventory.sqlite3"), ttl=0, max_age=86400)
+    args = clean_up_args(
+        "--package", "^firefox$", "--retention-days", "30", "--skip-delete"
+    )
+
+    async with registry.session() as session:
+        await scan_and_clean_up(args, session, cache)
+    package.publish(10)
+    async with registry.session() as session:
+        summary = await scan_and_clean_up(args, session, cache)
+
+    # The listing wasn't trusted to be ordered, so every version was listed.
+    assert summary.version_count == 58
+    assert registry.fetched_versions == 48 + 58
+    assert len(cache.versions(package.name)) == 58
+
+
+@pytest.mark.asyncio
+async def test_clean_up_cached_relist(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 1124}}, interval=timedelta(hours=1)
+    )
+    cache = InventoryCache(str(tmp_path / "inventory.sqlite3"), ttl=3600, max_age=86400)
+    args = clean_up_args("--package", "^firefox$")
+
+    async with registry.session() as session:
+        await scan_and_clean_up(
+            clean_up_args("--package", "^firefox$", "--skip-delete"), session, cache
+        )
+        summary = await scan_and_clean_up(args, session, cache)
+
+    # Checking the 1100 expired versions one by one would have taken more calls
+    # than listing the package again.
+    assert "get_version" not in registry.calls
+    assert registry.calls["list_versions"] == 2
+    assert summary.deleted_versions == 1100
+    package = "projects/fake-project/locations/us/repositories/mozilla/packages/firefox"
+    assert len(cache.versions(package)) == 24
+
+
+@pytest.mark.asyncio
+async def test_clean_up_adaptive_batch_size(monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 2024}}, interval=timedelta(hours=1)
+    )
+    args = clean_up_args("--package", "^firefox$", "--max-batch-size", "500")
+
+    async with registry.session() as session:
+        summary = await scan_and_clean_up(args, session, cache=None)
+        histograms = session.metrics.to_dict()["histograms"]
+
+    assert registry.deleted_versions == summary.expired_count == 2000
+    # Batches doubled every time one of the current size succeeded, instead of
+    # the 40 batches of 50 versions.
+    assert registry.calls["batch_delete_versions"] == 12
+    (batch_sizes,) = [h for h in histograms if h["name"] == "batch_size"]
+    assert batch_sizes["max"] == 400
+
+
+@pytest.mark.asyncio
+async def test_clean_up_max_runtime(monkeypatch, caplog):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 48, "firefox-l10n-fr": 200}},
+        interval=timedelta(hours=1),
+        lro_latency=0.4,
+    )
+    args = clean_up_args("--max-runtime", "1")
+
+    with (
+        caplog.at_level("INFO"),
+        patch("mozilla_linux_pkg_manager.cli.BATCH_SECONDS", 0.4),
+    ):
+        async with registry.session() as session:
+            summary = await scan_and_clean_up(args, session, cache=None)
+
+    # A second batch would have needed twice the time of the first one.
+    assert registry.calls["batch_delete_versions"] == 1
+    assert summary.deleted_versions == 50
+    assert summary.leftover_versions == 24 + 176 - 50
+    assert "left 150 expired versions of 2 packages for the next run" in caplog.text
+    # The oldest versions were deleted first.
+    prefix = "projects/fake-project/locations/us/repositories/mozilla/packages"
+    l10n = registry.packages[f"{prefix}/firefox-l10n-fr"]
+    assert l10n.deleted == set(range(50))
+
+
+@pytest.mark.asyncio
+async def test_clean_up_max_runtime_first_batches(monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox-l10n-fr": 224}},
+        interval=timedelta(hours=1),
+        lro_latency=0.4,
+    )
+    args = clean_up_args("--max-runtime", "1", "--delete-concurrency", "4")
+
+    async with registry.session() as session:
+        summary = await scan_and_clean_up(args, session, cache=None)
+
+    # Before any batch completed, none of them might finish in time.
+    assert registry.calls.get("batch_delete_versions", 0) == 0
+    assert summary.leftover_versions == 200
+
+
+@pytest.mark.asyncio
+async def test_clean_up_regions(monkeypatch, caplog):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {
+            "us/mozilla": {"firefox": 48},
+            "europe/mozilla": {"firefox": 72},
+            "asia/mozilla-esr": {"firefox": 96},
+        },
+        interval=timedelta(hours=1),
+    )
+    args = clean_up_args(
+        "--repository",
+        "mozilla",
+        "asia/mozilla-esr",
+        "--region",
+        "us",
+        "europe",
+        "--max-concurrent-requests",
+        "4",
+    )
+    rules = rules_from_args(args, registry.newest)
+    limiters = []
+
+    def record_fork(session):
+        forked = fork(session)
+        limiters.append(forked.limiter)
+        return forked
+
+    fork = Session.fork
+
+    with (
+        caplog.at_level("INFO"),
+        patch.object(type(registry.session()), "fork", record_fork),
+    ):
+        async with registry.session(max_concurrent_requests=4) as session:
+            summary = await clean_up_regions(
+                args, session, rules, None, None, ExpiryReport()
+            )
+
+    # Each region got a limiter of its own.
+    assert len(limiters) == 3
+    assert len({id(limiter) for limiter in limiters + [session.limiter]}) == 4
+    assert summary.expired_count == 24 + 48 + 72
+    assert summary.deleted_versions == 24 + 48 + 72
+    assert "Totals of the 3 regions:" in caplog.text
+    left = {
+        name.split("/")[3]: len(list(package.versions()))
+        for name, package in registry.packages.items()
+    }
+    assert left == {"us": 24, "europe": 24, "asia": 24}
+
+
+@pytest.mark.asyncio
+async def test_clean_up_repositories_error(monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {f"firefox-l10n-{index}": 1 for index in range(20)}},
+        page_latency=0.05,
+    )
+    args = clean_up_args("--repository", "mozilla", "missing")
+
+    with pytest.raises(ExceptionGroup) as exc_info:
+        async with registry.session() as session:
+            await scan_and_clean_up(args, session, cache=None)
+    listed = registry.calls.get("list_versions", 0)
+
+    assert exc_info.group_contains(api_exceptions.NotFound)
+    # The other repository was cancelled rather than left scanning.
+    await asyncio.sleep(0.5)
+    assert registry.calls.get("list_versions", 0) == listed
+
+
+@pytest.mark.asyncio
+async def test_clean_up_regions_error(monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    # There's no mozilla repository in europe.
+    registry = FakeArtifactRegistry(
+        {"us/mozilla": {"firefox": 1048}},
+        interval=timedelta(hours=1),
+        lro_latency=0.1,
+    )
+    args = clean_up_args("--region", "us", "europe")
+    rules = rules_from_args(args, registry.newest)
+
+    with pytest.raises(ExceptionGroup) as exc_info:
+        async with registry.session() as session:
+            await clean_up_regions(args, session, rules, None, None, ExpiryReport())
+
+    assert exc_info.group_contains(api_exceptions.NotFound)
+    # The other region was cancelled rather than left deleting.
+    await asyncio.sleep(0.5)
+    assert registry.calls.get("batch_delete_versions", 0) == 0
@@ -0,0 +1,63 @@
+import os
+from itertools import batched
+
+from mozilla_linux_pkg_manager.inventory import VersionInventory
+
+REPOSITORY = "projects/test-project/locations/us/repositories/my-repo"
+
+
+def test_version_inventory():
+    inventory = VersionInventory()
+    for package in ("firefox-l10n-fr", "firefox-l10n-de"):
+        package_id = inventory.add_package(f"{REPOSITORY}/packages/{package}")
+        for i in range(3):
+            inventory.add(package_id, f"42.0.{i}", 100 * i)
+
+    assert len(inventory) == 6
+    # Version names are shared between packages.
+    assert inventory.versions == ["42.0.0", "42.0.1", "42.0.2"]
+    assert inventory.add_package(f"{REPOSITORY}/packages/firefox-l10n-fr") == 0
+
+    selection = inventory.expired(150)
+    targets = inventory.targets(selection)
+    assert list(targets) == [
+        f"{REPOSITORY}/packages/firefox-l10n-de",
+        f"{REPOSITORY}/packages/firefox-l10n-fr",
+    ]
+    names = targets[f"{REPOSITORY}/packages/firefox-l10n-fr"]
+    assert len(names) == 2
+    assert list(names) == [
+        f"{REPOSITORY}/packages/firefox-l10n-fr/versions/42.0.0",
+        f"{REPOSITORY}/packages/firefox-l10n-fr/versions/42.0.1",
+    ]
+    assert [len(batch) for batch in batched(names, 1)] == [1, 1]
+    assert inventory.unique_versions(selection) == ["42.0.0", "42.0.1"]
+
+
+def test_version_inventory_nothing_expired():
+    inventory = VersionInventory()
+    package_id = inventory.add_package(f"{REPOSITORY}/packages/firefox")
+    inventory.add(package_id, "42.0", 100)
+
+    assert inventory.expired(100) == {}
+
+
+def test_version_inventory_batches_by_age():
+    inventory = VersionInventory()
+    create_times = {"firefox": (50, 10, 30, 70), "thunderbird": (20, 60, 40)}
+    for package, times in create_times.items():
+        package_id = inventory.add_package(f"{REPOSITORY}/packages/{package}")
+        for create_time in times:
+            inventory.add(package_id, f"1.0.{create_time}", create_time)
+
+    batches = inventory.batches_by_age(inventory.expired(65), lambda package: 2)
+
+    assert [
+        (os.path.basename(package), [os.path.basename(name) for name in names])
+        for package, names in batches
+    ] == [
+        ("firefox", ["1.0.10", "1.0.30"]),
+        ("thunderbird", ["1.0.20", "1.0.40"]),
+        ("firefox", ["1.0.50"]),
+        ("thunderbird", ["1.0.60"]),
+    ]
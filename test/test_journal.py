@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+import pytest
+from conftest import delete_args
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import (
+    CleanUpSummary,
+    batch_delete_versions,
+    resume_clean_up,
+)
+from mozilla_linux_pkg_manager.journal import Journal
+
+PACKAGE = "projects/fake-project/locations/us/repositories/mozilla/packages/firefox"
+
+
+def test_journal_pending(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    first = journal.plan(PACKAGE, [f"{PACKAGE}/versions/1.0.0"])
+    second = journal.plan(PACKAGE, [f"{PACKAGE}/versions/1.0.1"])
+    journal.done(first)
+    journal.close()
+
+    journal = Journal(path)
+    assert list(journal.pending()) == [(second, PACKAGE, [f"{PACKAGE}/versions/1.0.1"])]
+    # New batches don't reuse the ids of the resumed journal.
+    assert journal.plan(PACKAGE, []) == 2
+
+
+def test_journal_truncated_record(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(str(path))
+    batch_id = journal.plan(PACKAGE, [f"{PACKAGE}/versions/1.0.0"])
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"done": ')
+
+    journal = Journal(str(path))
+    assert list(journal.pending()) == [
+        (batch_id, PACKAGE, [f"{PACKAGE}/versions/1.0.0"])
+    ]
+    journal.done(batch_id)
+    assert journal.pending() == []
+
+
+@pytest.mark.asyncio
+async def test_batch_delete_versions_journal(tmp_path):
+    registry = FakeArtifactRegistry({"mozilla": {"firefox": 120}})
+    names = [f"{PACKAGE}/versions/1.0.{index}" for index in range(120)]
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+
+    async with registry.session() as session:
+        await batch_delete_versions(
+            {PACKAGE: names}, delete_args(), session=session, journal=journal
+        )
+
+    records = list(journal.records())
+    assert [record["batch"] for record in records[:3]] == [0, 1, 2]
+    assert sorted(record["done"] for record in records[3:]) == [0, 1, 2]
+    assert journal.pending() == []
+
+
+@pytest.mark.asyncio
+async def test_batch_delete_versions_journal_dry_run(tmp_path):
+    registry = FakeArtifactRegistry({"mozilla": {"firefox": 120}})
+    names = [f"{PACKAGE}/versions/1.0.{index}" for index in range(120)]
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+
+    async with registry.session() as session:
+        await batch_delete_versions(
+            {PACKAGE: names}, delete_args("--dry-run"), session=session, journal=journal
+        )
+
+    # Nothing is left for a resumed run to delete.
+    assert list(journal.records()) == []
+    assert journal.pending() == []
+
+
+@pytest.mark.asyncio
+async def test_resume_clean_up(tmp_path):
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 150}}, interval=timedelta(hours=1)
+    )
+    names = [f"{PACKAGE}/versions/1.0.{index}" for index in range(150)]
+    path = str(tmp_path / "journal.jsonl")
+    # An interrupted run that planned 3 batches and only finished the second.
+    journal = Journal(path)
+    for start in range(0, 150, 50):
+        journal.plan(PACKAGE, names[start : start + 50])
+    journal.done(1)
+    journal.close()
+
+    journal = Journal(path)
+    async with registry.session() as session:
+        await resume_clean_up(delete_args(), session, journal)
+
+    assert registry.calls["batch_delete_versions"] == 2
+    remaining = [version.name for version in registry.packages[PACKAGE].versions()]
+    assert remaining == names[50:100]
+    assert journal.pending() == []
+
+
+@pytest.mark.asyncio
+async def test_resume_clean_up_deleted(tmp_path):
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 50}}, interval=timedelta(hours=1)
+    )
+    names = [f"{PACKAGE}/versions/1.0.{index}" for index in range(50)]
+    # A run stopped while waiting for the operation of its batch, which still
+    # deleted every version of it.
+    registry.packages[PACKAGE].deleted.update(range(50))
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    journal.plan(PACKAGE, names)
+    journal.close()
+
+    journal = Journal(path)
+    async with registry.session() as session:
+        summary = await resume_clean_up(delete_args(), session, journal)
+
+    assert summary.failed_batches == []
+    assert summary.deleted_versions == 50
+    assert journal.pending() == []
+
+
+@pytest.mark.asyncio
+async def test_resume_clean_up_bisect(tmp_path):
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 400}}, interval=timedelta(hours=1)
+    )
+    names = [f"{PACKAGE}/versions/1.0.{index}" for index in range(400)]
+    # A version deleted since the interrupted run planned its batches.
+    registry.packages[PACKAGE].deleted.add(20)
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    for start in range(0, 400, 50):
+        journal.plan(PACKAGE, names[start : start + 50])
+    journal.close()
+
+    journal = Journal(path)
+    async with registry.session() as session:
+        summary = await resume_clean_up(delete_args(), session, journal)
+
+    # The halves of the split batch were only retried once: 8 batches, and
+    # 2 per level of the split down to the missing version.
+    assert registry.calls["batch_delete_versions"] == 8 + 2 * 6
+    # The missing version is gone either way.
+    assert summary.deleted_versions == 400
+    assert summary.failed_batches == []
+    assert list(registry.packages[PACKAGE].versions()) == []
+    assert journal.pending() == []
+
+
+@pytest.mark.asyncio
+async def test_batch_delete_versions_bisect(tmp_path):
+    registry = FakeArtifactRegistry({"mozilla": {"firefox": 120}})
+    names = [f"{PACKAGE}/versions/1.0.{index}" for index in range(120)]
+    # A version that was deleted since the scan fails its whole batch.
+    registry.packages[PACKAGE].deleted.add(70)
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    summary = CleanUpSummary()
+
+    async with registry.session() as session:
+        await batch_delete_versions(
+            {PACKAGE: names},
+            delete_args(),
+            session=session,
+            journal=journal,
+            summary=summary,
+        )
+
+    # The batch is split down to the missing version, which isn't a failure.
+    assert registry.calls["batch_delete_versions"] == 3 + 2 * 6
+    assert summary.failed_batches == []
+    assert summary.deleted_versions == 120
+    assert list(registry.packages[PACKAGE].versions()) == []
+    assert journal.pending() == []
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from mozilla_linux_pkg_manager.limiter import AdaptiveLimiter, BatchSizer
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_bounds_concurrency():
+    limiter = AdaptiveLimiter(3)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def call():
+        nonlocal in_flight, max_in_flight
+        async with limiter:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    await asyncio.gather(*(call() for _ in range(10)))
+
+    assert max_in_flight == 3
+    assert limiter.completed == 10
+    assert limiter.in_flight == 0
+
+
+def test_adaptive_limiter_decrease():
+    limiter = AdaptiveLimiter(32, cooldown=60)
+
+    limiter.on_error(api_exceptions.TooManyRequests(""))
+    assert limiter.limit == 16
+    # Errors from calls that were already in flight don't lower it further.
+    limiter.on_error(api_exceptions.ServiceUnavailable(""))
+    assert limiter.limit == 16
+    # Other errors don't say anything about the load.
+    limiter.last_decrease = 0
+    limiter.on_error(api_exceptions.InternalServerError(""))
+    assert limiter.limit == 16
+    assert limiter.overloads == 2
+
+
+def test_adaptive_limiter_increase():
+    limiter = AdaptiveLimiter(4, cooldown=0)
+    for _ in range(3):
+        limiter.on_error(api_exceptions.TooManyRequests(""))
+    assert limiter.limit == 1
+
+    for _ in range(3):
+        limiter.on_success()
+    assert int(limiter.limit) == 2
+
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 4
+
+
+def test_batch_sizer():
+    sizer = BatchSizer(50, 300, target_seconds=10)
+    sizer.on_success(50, 1)
+    assert sizer.size == 100
+    # Smaller batches say nothing about the current size.
+    sizer.on_success(50, 1)
+    sizer.on_success(20, 60)
+    assert sizer.size == 100
+    sizer.on_success(100, 1)
+    sizer.on_success(200, 1)
+    assert sizer.size == 300
+
+    sizer.on_success(300, 60)
+    assert sizer.size == 150
+    sizer.on_error(
+        150, api_exceptions.RetryError("", api_exceptions.DeadlineExceeded(""))
+    )
+    assert sizer.size == 75
+    # Errors that have nothing to do with the size of batches are ignored.
+    sizer.on_error(75, api_exceptions.NotFound(""))
+    assert sizer.size == 75
+    assert (sizer.largest, sizer.changes) == (300, 5)
+
+
+def test_batch_sizer_maximum():
+    assert BatchSizer(50, 10).size == 10
+    sizer = BatchSizer(50, 50)
+    sizer.on_success(50, 0)
+    assert (sizer.size, sizer.changes) == (50, 0)
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from conftest import delete_args
+
+import mozilla_linux_pkg_manager
+
+HEAVY_PACKAGES = {"google", "grpc", "requests"}
+
+
+def run_main(*argv):
+    """Run `main` in a fresh interpreter, returning its exit code and heavy imports."""
+    code = f"""
+import sys
+sys.argv = ["mozilla-linux-pkg-manager", *{argv!r}]
+from mozilla_linux_pkg_manager.main import main
+try:
+    main()
+except SystemExit as e:
+    code = e.code
+print(sorted({{name.split(".")[0] for name in sys.modules}} & {HEAVY_PACKAGES!r}))
+sys.exit(code)
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+    )
+    return result.returncode, result.stdout.splitlines()[-1]
+
+
+@pytest.mark.parametrize(
+    "argv,returncode",
+    [
+        (["--help"], 0),
+        (["clean-up", "--help"], 0),
+        # Missing required options.
+        (["clean-up", "--package", "^firefox$"], 2),
+        (["apply", "--plan", "plan.jsonl", "--shard-index", "3"], 2),
+        (["inventory", "--repository", "mozilla", "--output", "inventory.snp"], 2),
+    ],
+)
+def test_main_doesnt_load_api_clients(argv, returncode):
+    assert run_main(*argv) == (returncode, "[]")
+
+
+@pytest.mark.parametrize("option", ["--max-concurrent-requests", "--prefetch-pages"])
+def test_negative_option(option, capsys):
+    with pytest.raises(SystemExit):
+        delete_args(option, "-1")
+    assert "-1 is a negative integer" in capsys.readouterr().err
+
+
+def test_package_cli_attribute():
+    # The package loads `cli` on first use rather than on import.
+    assert mozilla_linux_pkg_manager.cli.clean_up
@@ -0,0 +1,96 @@
+import json
+from datetime import timedelta
+
+import pytest
+from conftest import clean_up_args
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import scan_and_clean_up
+from mozilla_linux_pkg_manager.metrics import Histogram, Metrics
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    assert list(histogram.cumulative_counts()) == [(0.1, 2), (1, 3), (float("inf"), 4)]
+    assert histogram.sum == pytest.approx(2.65)
+    assert histogram.max == 2
+
+
+def test_prometheus():
+    metrics = Metrics()
+    metrics.increment("retries_total", method="list_versions", exception="Aborted")
+    metrics.increment("retries_total", method="list_versions", exception="Aborted")
+    metrics.observe("rpc_seconds", 0.2, method="get_version", repository='a"b')
+
+    text = metrics.to_prometheus(prefix="")
+
+    assert "# TYPE retries_total counter\n" in text
+    assert 'retries_total{exception="Aborted",method="list_versions"} 2\n' in text
+    assert "# TYPE rpc_seconds histogram\n" in text
+    assert (
+        'rpc_seconds_bucket{method="get_version",repository="a\\"b",le="0.1"} 0\n'
+        in text
+    )
+    assert (
+        'rpc_seconds_bucket{method="get_version",repository="a\\"b",le="+Inf"} 1\n'
+        in text
+    )
+    assert 'rpc_seconds_count{method="get_version",repository="a\\"b"} 1\n' in text
+    assert "max_rss_bytes " in text
+
+
+@pytest.mark.asyncio
+async def test_clean_up_metrics(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 48, "firefox-l10n-fr": 1048}},
+        interval=timedelta(hours=1),
+        error_rate=0.05,
+        seed=1,
+    )
+    args = clean_up_args()
+
+    async with registry.session() as session:
+        await scan_and_clean_up(args, session, cache=None)
+    session.metrics.write(tmp_path / "metrics.json", tmp_path / "metrics.prom")
+
+    with open(tmp_path / "metrics.json") as f:
+        report = json.load(f)
+    counters = {
+        (counter["name"], tuple(sorted(counter["labels"].items()))): counter["value"]
+        for counter in report["counters"]
+    }
+    histograms = {
+        (histogram["name"], tuple(sorted(histogram["labels"].items()))): histogram
+        for histogram in report["histograms"]
+    }
+    assert counters["pages_total", (("method", "list_versions"),)] == 3
+    assert counters["pages_total", (("method", "list_packages"),)] == 1
+    assert (
+        counters["batches_total", (("outcome", "succeeded"), ("repository", "mozilla"))]
+        == 22
+    )
+    # Every injected error was retried and counted.
+    assert sum(
+        value for (name, _), value in counters.items() if name == "retries_total"
+    ) == sum(registry.calls.values()) - sum(
+        histogram["count"]
+        for (name, _), histogram in histograms.items()
+        if name in ("rpc_seconds", "page_seconds")
+    )
+    assert (
+        histograms[
+            "rpc_seconds", (("method", "list_versions"), ("repository", "mozilla"))
+        ]["count"]
+        == 2
+    )
+    assert histograms["lro_wait_seconds", (("repository", "mozilla"),)]["count"] == 22
+    assert histograms["phase_seconds", (("phase", "scan"),)]["count"] == 1
+    assert histograms["phase_seconds", (("phase", "delete"),)]["count"] == 1
+    prefix = "projects/fake-project/locations/us/repositories/mozilla/packages"
+    assert report["packages"][f"{prefix}/firefox-l10n-fr"]["versions"] == 1048
+    assert report["max_rss_bytes"] > 0
+    assert (tmp_path / "metrics.prom").read_text().startswith("# TYPE")
@@ -1,19 +1,25 @@
+import asyncio
+import logging
 import sys
+import time
 import types
-from argparse import Namespace
 from datetime import UTC, datetime, timedelta
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
 
 import pytest
 import requests
 import requests.exceptions as requests_exceptions
+from conftest import clean_up_args, delete_args
 from google.api_core import exceptions as api_exceptions
 from google.auth import exceptions as auth_exceptions
 from google.cloud import artifactregistry_v1
 
 import mozilla_linux_pkg_manager  # noqa
 from mozilla_linux_pkg_manager.cli import (
+    CleanUpSummary,
+    RateLimiter,
     batch_delete_versions,
+    batch_error,
     clean_up,
     get_repository,
     list_packages,
@@ -107,8 +113,7 @@ async def test_list_versions():
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("dry_run", [True, False])
-async def test_batch_delete_versions(dry_run):
+async def test_batch_delete_versions():
     mock_client = AsyncMock()
     mock_operation = AsyncMock()
     mock_client.batch_delete_versions.return_value = mock_operation
@@ -118,7 +123,7 @@ async def test_batch_delete_versions(dry_run):
     version_names = [f"{package_name}/versions/42.0.{i}" for i in range(120)]
     tb_version_names = [f"{tb_package_name}/versions/42.0.{i}" for i in range(10)]
     targets = {package_name: set(version_names), tb_package_name: set(tb_version_names)}
-    args = Namespace(dry_run=dry_run)
+    args = delete_args()
 
     with patch(
         "mozilla_linux_pkg_manager.cli.artifactregistry_v1.ArtifactRegistryAsyncClient",
@@ -135,7 +140,7 @@ async def test_batch_delete_versions(dry_run):
         call_kwargs = call.kwargs
         expected_parent = package_name if expected_batch_size != 10 else tb_package_name
         assert call_kwargs["request"].parent == expected_parent
-        assert call_kwargs["request"].validate_only is dry_run
+        assert call_kwargs["request"].validate_only is False
         assert len(call_kwargs["request"].names) == expected_batch_size
         all_deleted_versions.update(call_kwargs["request"].names)
 
@@ -143,6 +148,63 @@ async def test_batch_delete_versions(dry_run):
     assert mock_operation.result.call_count == 4
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("validate_sample", [0, 1, 5])
+async def test_batch_delete_versions_dry_run(validate_sample):
+    mock_client = AsyncMock()
+    mock_client.batch_delete_versions.return_value = AsyncMock()
+
+    repo_name = "projects/test-project/locations/us-central1/repositories/my-repo"
+    targets = {
+        f"{repo_name}/packages/{name}": [
+            f"{repo_name}/packages/{name}/versions/42.0.{i}" for i in range(120)
+        ]
+        for name in ("firefox", "thunderbird")
+    }
+    args = delete_args(
+        "--dry-run",
+        *(["--validate-sample", str(validate_sample)] if validate_sample else []),
+    )
+    summary = CleanUpSummary()
+
+    with patch(
+        "mozilla_linux_pkg_manager.cli.artifactregistry_v1.ArtifactRegistryAsyncClient",
+        return_value=mock_client,
+    ):
+        await batch_delete_versions(targets, args, summary=summary)
+
+    # Only the first batch of up to `validate_sample` packages reaches the API.
+    calls = mock_client.batch_delete_versions.call_args_list
+    assert len(calls) == min(validate_sample, 2)
+    assert [call.kwargs["request"].parent for call in calls] == list(targets)[
+        :validate_sample
+    ]
+    assert all(call.kwargs["request"].validate_only for call in calls)
+    assert (summary.succeeded_batches, summary.failed_batches) == (6, [])
+    assert summary.deleted_versions == 240
+
+
+def test_batch_error():
+    package = "projects/test-project/locations/us/repositories/my-repo/packages/firefox"
+    names = [f"{package}/versions/42.0.{i}" for i in range(3)]
+
+    assert batch_error(package, names, 50) is None
+    assert batch_error(package, names, 2) == "Batch of 3 versions, expected 1 to 2"
+    assert batch_error(package, [], 50) == "Batch of 0 versions, expected 1 to 50"
+    assert batch_error("firefox", names, 50) == "firefox isn't the name of a package"
+    assert batch_error(package, [*names, names[0]], 50) == (
+        "Batch with duplicate versions"
+    )
+    for name in (
+        f"{package}-beta/versions/42.0",
+        f"{package}/versions/",
+        f"{package}/versions/42.0/files/firefox.deb",
+    ):
+        assert batch_error(package, [name], 50) == (
+            f"{name} isn't the name of a version of {package}"
+        )
+
+
 @pytest.mark.asyncio
 async def test_batch_delete_versions_multiple_repositories():
     mock_client = AsyncMock()
@@ -154,7 +216,7 @@ async def test_batch_delete_versions_multiple_repositories():
     repo1_versions = [f"{repo1_package}/versions/42.0.{i}" for i in range(3)]
     repo2_versions = [f"{repo2_package}/versions/43.0.{i}" for i in range(2)]
     targets = {repo1_package: set(repo1_versions), repo2_package: set(repo2_versions)}
-    args = Namespace(dry_run=False)
+    args = delete_args()
 
     with patch(
         "mozilla_linux_pkg_manager.cli.artifactregistry_v1.ArtifactRegistryAsyncClient",
@@ -180,6 +242,58 @@ async def test_batch_delete_versions_multiple_repositories():
     assert mock_operation.result.call_count == 2
 
 
+@pytest.mark.asyncio
+async def test_batch_delete_versions_concurrency():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def result():
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    async def mock_batch_delete_side_effect(request, retry):
+        if request.parent.endswith("thunderbird"):
+            raise api_exceptions.ServiceUnavailable("")
+        return MagicMock(result=result)
+
+    mock_client = AsyncMock()
+    mock_client.batch_delete_versions.side_effect = mock_batch_delete_side_effect
+
+    repo_name = "projects/test-project/locations/us-central1/repositories/my-repo"
+    targets = {
+        f"{repo_name}/packages/{name}": {
+            f"{repo_name}/packages/{name}/versions/42.0.{i}" for i in range(100)
+        }
+        for name in ("firefox", "firefox-beta", "thunderbird")
+    }
+    args = delete_args("--delete-concurrency", "3")
+
+    with (
+        patch(
+            "mozilla_linux_pkg_manager.cli.artifactregistry_v1.ArtifactRegistryAsyncClient",
+            return_value=mock_client,
+        ),
+        pytest.raises(SystemExit) as exc_info,
+    ):
+        await batch_delete_versions(targets, args)
+
+    assert exc_info.value.code == 1
+    assert mock_client.batch_delete_versions.call_count == 6
+    assert max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter():
+    limiter = RateLimiter(100)
+    start = time.monotonic()
+    for _ in range(5):
+        await limiter.wait()
+    assert time.monotonic() - start >= 0.04
+
+
 async def async_iter(items):
     for item in items:
         yield item
@@ -205,13 +319,16 @@ async def test_clean_up(dry_run):
     fresh_version.name = f"{package_name}/versions/42.0.0"
     fresh_version.create_time = now - timedelta(days=5)
 
-    args = Namespace(
-        package="^firefox$",
-        repository=["my-repo"],
-        region="us-central1",
-        retention_days=30,
-        dry_run=dry_run,
-        skip_delete=False,
+    args = clean_up_args(
+        "--region",
+        "us-central1",
+        "--retention-days",
+        "30",
+        "--package",
+        "^firefox$",
+        "--repository",
+        "my-repo",
+        *(["--dry-run"] if dry_run else []),
     )
 
     with (
@@ -233,10 +350,10 @@ async def test_clean_up(dry_run):
     ):
         await clean_up(args)
 
-    mock_get_repo.assert_called_once_with("us-central1", "my-repo")
+    mock_get_repo.assert_called_once_with("us-central1", "my-repo", session=ANY)
 
     # list_versions should only be called for matching package (firefox, not thunderbird in this case)
-    mock_list_versions.assert_called_once_with(mock_package)
+    mock_list_versions.assert_called_once_with(mock_package, session=ANY)
 
     mock_batch_delete.assert_called_once()
     call_args = mock_batch_delete.call_args
@@ -244,7 +361,7 @@ async def test_clean_up(dry_run):
 
     assert package_name in targets
     assert package_name_no_match not in targets
-    assert targets[package_name] == {expired_version.name}
+    assert set(targets[package_name]) == {expired_version.name}
     assert call_args[0][1] == args
 
 
@@ -270,26 +387,30 @@ async def test_clean_up_multiple_repositories(dry_run):
     expired_version2.name = f"{package2_name}/versions/43.0.0"
     expired_version2.create_time = now - timedelta(days=100)
 
-    args = Namespace(
-        package="^firefox.*$",
-        repository=["repo1", "repo2"],
-        region="us-central1",
-        retention_days=30,
-        dry_run=dry_run,
-        skip_delete=False,
+    args = clean_up_args(
+        "--region",
+        "us-central1",
+        "--retention-days",
+        "30",
+        "--package",
+        "^firefox.*$",
+        "--repository",
+        "repo1",
+        "repo2",
+        *(["--dry-run"] if dry_run else []),
     )
 
-    async def mock_get_repo_side_effect(region, repo_name):
+    async def mock_get_repo_side_effect(region, repo_name, session=None):
         if repo_name == "repo1":
             return mock_repository1
         return mock_repository2
 
-    def mock_list_packages_side_effect(repo):
+    def mock_list_packages_side_effect(repo, session=None):
         if repo.name == repo1_name:
             return async_iter([mock_package1])
         return async_iter([mock_package2])
 
-    def mock_list_versions_side_effect(package):
+    def mock_list_versions_side_effect(package, session=None):
         if package.name == package1_name:
             return async_iter([expired_version1])
         return async_iter([expired_version2])
@@ -314,8 +435,8 @@ async def test_clean_up_multiple_repositories(dry_run):
         await clean_up(args)
 
     assert mock_get_repo.call_count == 2
-    mock_get_repo.assert_any_call("us-central1", "repo1")
-    mock_get_repo.assert_any_call("us-central1", "repo2")
+    mock_get_repo.assert_any_call("us-central1", "repo1", session=ANY)
+    mock_get_repo.assert_any_call("us-central1", "repo2", session=ANY)
 
     mock_batch_delete.assert_called_once()
     call_args = mock_batch_delete.call_args
@@ -323,8 +444,207 @@ async def test_clean_up_multiple_repositories(dry_run):
 
     assert package1_name in targets
     assert package2_name in targets
-    assert targets[package1_name] == {expired_version1.name}
-    assert targets[package2_name] == {expired_version2.name}
+    assert set(targets[package1_name]) == {expired_version1.name}
+    assert set(targets[package2_name]) == {expired_version2.name}
+
+
+@pytest.mark.asyncio
+async def test_clean_up_scan_concurrency():
+    repo_name = "projects/test-project/locations/us-central1/repositories/my-repo"
+    package_names = [f"{repo_name}/packages/firefox-l10n-{i}" for i in range(6)]
+    mock_repository = artifactregistry_v1.Repository(name=repo_name)
+    mock_packages = [artifactregistry_v1.Package(name=name) for name in package_names]
+
+    now = datetime.now(UTC)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def mock_list_versions_side_effect(package, session=None):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # Finish the scans in reverse order to check the merge is deterministic.
+        await asyncio.sleep(
+            0.01 * (len(package_names) - package_names.index(package.name))
+        )
+        in_flight -= 1
+        expired_version = MagicMock()
+        expired_version.name = f"{package.name}/versions/43.0.0"
+        expired_version.create_time = now - timedelta(days=100)
+        return async_iter([expired_version])
+
+    args = clean_up_args(
+        "--region",
+        "us-central1",
+        "--retention-days",
+        "30",
+        "--package",
+        "^firefox-l10n-.*$",
+        "--repository",
+        "my-repo",
+        "--scan-concurrency",
+        "2",
+    )
+
+    with (
+        patch(
+            "mozilla_linux_pkg_manager.cli.get_repository",
+            return_value=mock_repository,
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.list_packages",
+            return_value=async_iter(mock_packages),
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.list_versions",
+            side_effect=mock_list_versions_side_effect,
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.batch_delete_versions",
+        ) as mock_batch_delete,
+    ):
+        await clean_up(args)
+
+    assert max_in_flight == 2
+    targets = mock_batch_delete.call_args[0][0]
+    assert list(targets) == package_names
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [True, False])
+async def test_clean_up_stream(stream, caplog):
+    repo_name = "projects/test-project/locations/us-central1/repositories/my-repo"
+    package_name = f"{repo_name}/packages/firefox"
+    mock_repository = artifactregistry_v1.Repository(name=repo_name)
+    mock_package = artifactregistry_v1.Package(name=package_name)
+
+    now = datetime.now(UTC)
+    events = []
+
+    async def versions():
+        for i in range(130):
+            await asyncio.sleep(0)
+            events.append("list")
+            version = MagicMock()
+            version.name = f"{package_name}/versions/42.0.{i}"
+            version.create_time = now - timedelta(days=100 if i < 120 else 1)
+            yield version
+
+    async def mock_batch_delete_side_effect(request, retry):
+        events.append("delete")
+        return AsyncMock()
+
+    mock_client = AsyncMock()
+    mock_client.batch_delete_versions.side_effect = mock_batch_delete_side_effect
+
+    args = clean_up_args(
+        "--region",
+        "us-central1",
+        "--retention-days",
+        "30",
+        "--package",
+        "^firefox$",
+        "--repository",
+        "my-repo",
+        *(["--stream"] if stream else []),
+    )
+
+    with (
+        caplog.at_level(logging.INFO),
+        patch(
+            "mozilla_linux_pkg_manager.cli.artifactregistry_v1.ArtifactRegistryAsyncClient",
+            return_value=mock_client,
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.get_repository",
+            return_value=mock_repository,
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.list_packages",
+            return_value=async_iter([mock_package]),
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.list_versions",
+            return_value=versions(),
+        ),
+    ):
+        await clean_up(args)
+
+    assert events.count("delete") == 3
+    # Deletions only overlap with the scan in streaming mode.
+    assert (events.index("delete") < len(events) - 3) is stream
+    assert "There's a total of 120 expired versions to clean-up!" in caplog.text
+    assert (
+        "There's a total of 130 versions. After clean-up, there will be 10 versions left."
+        in caplog.text
+    )
+
+
+@pytest.mark.asyncio
+async def test_clean_up_cache(tmp_path):
+    repo_name = "projects/test-project/locations/us-central1/repositories/my-repo"
+    package_name = f"{repo_name}/packages/firefox"
+    mock_repository = artifactregistry_v1.Repository(name=repo_name)
+    mock_package = artifactregistry_v1.Package(name=package_name)
+
+    now = datetime.now(UTC)
+    versions = []
+    for i, age in enumerate((100, 90, 5)):
+        version = MagicMock()
+        version.name = f"{package_name}/versions/42.0.{i}"
+        version.create_time = now - timedelta(days=age)
+        versions.append(version)
+
+    args = clean_up_args(
+        "--region",
+        "us-central1",
+        "--retention-days",
+        "30",
+        "--package",
+        "^firefox$",
+        "--repository",
+        "my-repo",
+        "--cache-dir",
+        str(tmp_path),
+    )
+
+    async def mock_get_version_side_effect(name, session=None):
+        # 42.0.0 was deleted by someone else since the last run.
+        if name.endswith("42.0.0"):
+            raise api_exceptions.NotFound("")
+
+    # The first run fills the cache, the second one is answered from it.
+    list_versions_calls = []
+    for _ in range(2):
+        with (
+            patch(
+                "mozilla_linux_pkg_manager.cli.get_repository",
+                return_value=mock_repository,
+            ),
+            patch(
+                "mozilla_linux_pkg_manager.cli.list_packages",
+                return_value=async_iter([mock_package]),
+            ),
+            patch(
+                "mozilla_linux_pkg_manager.cli.list_versions",
+                return_value=async_iter(versions),
+            ) as mock_list_versions,
+            patch(
+                "mozilla_linux_pkg_manager.cli.get_version",
+                side_effect=mock_get_version_side_effect,
+            ) as mock_get_version,
+            patch(
+                "mozilla_linux_pkg_manager.cli.batch_delete_versions",
+            ) as mock_batch_delete,
+        ):
+            await clean_up(args)
+        list_versions_calls.append(mock_list_versions.call_count)
+
+    assert list_versions_calls == [1, 0]
+    assert mock_get_version.call_count == 2
+    targets = mock_batch_delete.call_args[0][0]
+    assert list(targets) == [package_name]
+    assert set(targets[package_name]) == {versions[1].name}
 
 
 @pytest.mark.parametrize(
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+import pytest
+from conftest import clean_up_args
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import delete_batches, get_parser, scan_and_clean_up
+from mozilla_linux_pkg_manager.plan import read_plan, write_plan
+
+PREFIX = "projects/fake-project/locations/us/repositories/mozilla/packages"
+
+
+def test_plan_round_trip(tmp_path):
+    path = str(tmp_path / "plan.jsonl")
+    targets = {
+        f"{PREFIX}/firefox": [f"{PREFIX}/firefox/versions/1.0.{i}" for i in range(5)],
+        f"{PREFIX}/thunderbird": [f"{PREFIX}/thunderbird/versions/2.0"],
+    }
+
+    assert write_plan(path, targets, batch_size=2) == 4
+    with open(path) as f:
+        assert f.readline() == f'{{"package": "{PREFIX}/firefox", "count": 5}}\n'
+        assert f.readline() == '{"versions": ["1.0.0", "1.0.1"]}\n'
+
+    assert list(read_plan(path)) == [
+        (f"{PREFIX}/firefox", targets[f"{PREFIX}/firefox"][0:2]),
+        (f"{PREFIX}/firefox", targets[f"{PREFIX}/firefox"][2:4]),
+        (f"{PREFIX}/firefox", targets[f"{PREFIX}/firefox"][4:5]),
+        (f"{PREFIX}/thunderbird", targets[f"{PREFIX}/thunderbird"]),
+    ]
+    shards = [list(read_plan(path, index, 3)) for index in range(3)]
+    assert [len(shard) for shard in shards] == [2, 1, 1]
+    assert sorted(sum(shards, [])) == sorted(read_plan(path))
+
+
+def test_read_plan_invalid(tmp_path):
+    path = tmp_path / "plan.jsonl"
+    path.write_text('{"versions": ["1.0"]}\n')
+
+    with pytest.raises(ValueError, match="without a package"):
+        list(read_plan(str(path)))
+
+
+@pytest.mark.asyncio
+async def test_plan_and_apply(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 148, "thunderbird": 48}},
+        interval=timedelta(hours=1),
+    )
+    path = str(tmp_path / "plan.jsonl")
+    parser = get_parser()
+    args = clean_up_args("--package", ".*", "--plan-out", path)
+
+    async with registry.session() as session:
+        await scan_and_clean_up(args, session, cache=None)
+        # Planning doesn't delete anything.
+        assert registry.deleted_versions == 0
+
+        for shard_index in range(2):
+            args = parser.parse_args(
+                [
+                    "apply",
+                    "--plan",
+                    path,
+                    "--shard-index",
+                    str(shard_index),
+                    "--shard-count",
+                    "2",
+                ]
+            )
+            batches = read_plan(args.plan, args.shard_index, args.shard_count)
+            await delete_batches(args, session, ((None, *batch) for batch in batches))
+
+    assert registry.deleted_versions == 124 + 24
+    assert registry.calls["batch_delete_versions"] == 4
+    assert len(list(registry.packages[f"{PREFIX}/firefox"].versions())) == 24
+    assert len(list(registry.packages[f"{PREFIX}/thunderbird"].versions())) == 24
@@ -0,0 +1,143 @@
+from array import array
+from datetime import UTC, datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from conftest import clean_up_args
+from google.cloud import artifactregistry_v1
+
+from mozilla_linux_pkg_manager.cli import clean_up, get_parser
+from mozilla_linux_pkg_manager.inventory import VersionInventory
+from mozilla_linux_pkg_manager.policy import RetentionPolicy, parse_version
+
+REPO_NAME = "projects/test-project/locations/us/repositories/my-repo"
+PACKAGE = f"{REPO_NAME}/packages/firefox"
+VERSIONS = [
+    "128.0",
+    "128.0.2",
+    "128.1.0esr",
+    "129.0~b1",
+    "129.0~b9",
+    "129.0",
+    "130.0a1~20240701094424",
+    "not-a-version",
+]
+
+
+@pytest.mark.parametrize(
+    "version,expected",
+    [
+        ("129.0", "129.0"),
+        ("129.0~b9", "129.0b9"),
+        ("129.0%7Eb9", "129.0b9"),
+        ("130.0a1~20240701094424", "130.0a1"),
+        ("128.1.0esr", "128.1.0esr"),
+        ("1:128.0.2-1", "128.0.2"),
+        ("129.0~build2", "129.0"),
+        ("not-a-version", None),
+    ],
+)
+def test_parse_version(version, expected):
+    parsed = parse_version(version)
+    assert (str(parsed) if parsed else None) == expected
+
+
+def test_protected():
+    assert RetentionPolicy(keep_esr=True).protected(VERSIONS) == {2}
+    # 128.1.0esr is the newest 128, 129.0 sorts after its betas.
+    assert RetentionPolicy(keep_latest_per_major=1).protected(VERSIONS) == {2, 5, 6}
+    assert RetentionPolicy(keep_latest_per_major=2).protected(VERSIONS) == {
+        1,
+        2,
+        4,
+        5,
+        6,
+    }
+    # The newest nightly and build are kept, whatever the listing order.
+    nightlies = [
+        "131.0a1~20240801094424",
+        "131.0a1~20240803094424",
+        "131.0a1~20240802094424",
+    ]
+    assert RetentionPolicy(keep_latest_per_major=1).protected(nightlies) == {1}
+    assert RetentionPolicy(keep_latest_per_major=2).protected(nightlies) == {1, 2}
+    builds = ["130.0~build1", "130.0~build3", "130.0~build2"]
+    assert RetentionPolicy(keep_latest_per_major=1).protected(builds) == {1}
+
+
+def test_select():
+    inventory = VersionInventory()
+    package_id = inventory.add_package(PACKAGE)
+    for create_time, version in enumerate(VERSIONS):
+        inventory.add(package_id, version, create_time)
+    policy = RetentionPolicy(keep_latest_per_major=1, keep_esr=True)
+
+    selection = policy.select(inventory, inventory.expired(cutoff=100))
+
+    assert sorted(inventory.targets(selection)[PACKAGE]) == sorted(
+        f"{PACKAGE}/versions/{VERSIONS[i]}" for i in (0, 1, 3, 4, 7)
+    )
+    assert policy.select(inventory, {package_id: array("I", [2, 5, 6])}) == {}
+
+
+def test_from_args():
+    args = get_parser().parse_args(["clean-up"])
+    assert RetentionPolicy.from_args(args) is None
+    args = clean_up_args("--keep-latest-per-major", "3")
+    assert RetentionPolicy.from_args(args).keep_latest_per_major == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [True, False])
+async def test_clean_up_policy(stream):
+    now = datetime.now(UTC)
+    versions = []
+    for version in VERSIONS:
+        versions.append(MagicMock(create_time=now - timedelta(days=100)))
+        versions[-1].name = f"{PACKAGE}/versions/{version}"
+
+    async def async_iter(items):
+        for item in items:
+            yield item
+
+    mock_client = AsyncMock()
+    args = clean_up_args(
+        "--package",
+        "^firefox$",
+        "--repository",
+        "my-repo",
+        "--retention-days",
+        "30",
+        "--max-concurrent-requests",
+        "0",
+        "--keep-latest-per-major",
+        "1",
+        "--keep-esr",
+        *(["--stream"] if stream else []),
+    )
+
+    with (
+        patch(
+            "mozilla_linux_pkg_manager.cli.artifactregistry_v1.ArtifactRegistryAsyncClient",
+            return_value=mock_client,
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.get_repository",
+            return_value=artifactregistry_v1.Repository(name=REPO_NAME),
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.list_packages",
+            return_value=async_iter([artifactregistry_v1.Package(name=PACKAGE)]),
+        ),
+        patch(
+            "mozilla_linux_pkg_manager.cli.list_versions",
+            return_value=async_iter(versions),
+        ),
+    ):
+        summary = await clean_up(args)
+
+    assert summary.expired_count == 5
+    (call,) = mock_client.batch_delete_versions.call_args_list
+    assert sorted(call.kwargs["request"].names) == sorted(
+        f"{PACKAGE}/versions/{VERSIONS[i]}" for i in (0, 1, 3, 4, 7)
+    )
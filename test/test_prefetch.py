@@ -0,0 +1,107 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import list_versions, paged
+from mozilla_linux_pkg_manager.prefetch import prefetched
+
+
+async def numbers(count, fetched, error=None):
+    for number in range(count):
+        await asyncio.sleep(0)
+        fetched.append(number)
+        yield number
+    if error:
+        raise error
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("depth", [0, 1, 3])
+async def test_prefetched(depth):
+    fetched = []
+    items = []
+    async for item in prefetched(numbers(10, fetched), depth):
+        # Let the background task run as far ahead as it can.
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # The item being processed, the queued ones and the one waiting to be
+        # queued.
+        assert len(fetched) <= item + 1 + depth + (depth > 0)
+        items.append(item)
+
+    assert items == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_prefetched_error():
+    items = []
+    with pytest.raises(ValueError, match="page 3"):
+        async for item in prefetched(numbers(3, [], ValueError("page 3")), 2):
+            items.append(item)
+
+    assert items == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_prefetched_stops_early():
+    fetched = []
+    iterator = prefetched(numbers(100, fetched), 2)
+    async for item in iterator:
+        if item == 1:
+            break
+    await iterator.aclose()
+    await asyncio.sleep(0.01)
+
+    assert len(fetched) < 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("prefetch_pages", [0, 1])
+async def test_paged_prefetch(prefetch_pages, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 4500}}, interval=timedelta(hours=1), page_latency=0.1
+    )
+    package = registry.packages[
+        "projects/fake-project/locations/us/repositories/mozilla/packages/firefox"
+    ]
+
+    async with registry.session(prefetch_pages=prefetch_pages) as session:
+        versions = await list_versions(package, session)
+        start = time.perf_counter()
+        count = 0
+        async for _ in paged(versions, "versions", session, "list_versions"):
+            count += 1
+            if count % 1000 == 0:
+                # Process each page for as long as the next one takes to come.
+                await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - start
+
+    assert count == package.version_count
+    assert session.metrics.counters["pages_total", (("method", "list_versions"),)] == 5
+    # Fetching the 4 pages after the first one overlaps with processing the
+    # 4 full ones when prefetching.
+    if prefetch_pages:
+        assert elapsed < 0.7
+    else:
+        assert elapsed >= 0.8
+
+
+@pytest.mark.asyncio
+async def test_paged_limiter(monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry({"mozilla": {"firefox": 4500}})
+    package = registry.packages[
+        "projects/fake-project/locations/us/repositories/mozilla/packages/firefox"
+    ]
+
+    async with registry.session(max_concurrent_requests=4) as session:
+        versions = await list_versions(package, session)
+        async for _ in paged(versions, "versions", session, "list_versions"):
+            pass
+
+    # The list call and the 4 pages after the first one.
+    assert session.limiter.completed == 1 + 4
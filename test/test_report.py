@@ -0,0 +1,85 @@
+import json
+import logging
+from datetime import timedelta
+
+import pytest
+from conftest import clean_up_args
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import scan_and_clean_up
+from mozilla_linux_pkg_manager.inventory import VersionInventory
+from mozilla_linux_pkg_manager.report import ExpiryReport, format_sample
+
+NOW = 1722470400
+DAY = 86400
+
+
+def test_format_sample():
+    assert format_sample(["1.0", "2.0"]) == "1.0, 2.0"
+    assert format_sample([str(i) for i in range(12)], size=3) == "0, 1, 2, ... (9 more)"
+
+
+def test_expiry_report(tmp_path, caplog):
+    path = tmp_path / "expired.jsonl"
+    report = ExpiryReport(str(path), now=NOW)
+    for package, count in (("firefox", 3), ("firefox-l10n-fr", 5), ("thunderbird", 1)):
+        for index in range(count):
+            report.add(f"packages/{package}", f"1.0.{index}", NOW - 10 * index * DAY)
+    report.close()
+
+    with caplog.at_level(logging.INFO):
+        report.log(top=2)
+
+    assert "Top 2 of 3 packages by expired versions:" in caplog.text
+    assert "  firefox-l10n-fr: 5\n" in caplog.text
+    assert "  firefox: 3\n" in caplog.text
+    assert "thunderbird" not in caplog.text
+    assert "  0-7 days: 3\n" in caplog.text
+    assert "  7-30 days: 5\n" in caplog.text
+    assert "  30-90 days: 1\n" in caplog.text
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 9
+    assert records[1] == {
+        "package": "packages/firefox",
+        "version": "1.0.1",
+        "create_time": NOW - 10 * DAY,
+    }
+
+
+def test_expiry_report_selection():
+    inventory = VersionInventory()
+    package_id = inventory.add_package("packages/firefox")
+    for index in range(4):
+        inventory.add(package_id, f"1.0.{index}", NOW - 1000 * index * DAY)
+    report = ExpiryReport(now=NOW)
+
+    report.add_selection(inventory, inventory.expired(NOW - DAY))
+
+    assert report.counts == {"packages/firefox": 3}
+    assert report.ages.counts == [0, 0, 0, 0, 0, 0, 3]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [True, False])
+async def test_clean_up_report(stream, tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {"mozilla": {"firefox": 48, "firefox-l10n-fr": 72}},
+        interval=timedelta(hours=1),
+    )
+    path = tmp_path / "expired.jsonl"
+    args = clean_up_args("--dry-run", *(["--stream"] if stream else []))
+    report = ExpiryReport(str(path))
+
+    with caplog.at_level(logging.INFO):
+        async with registry.session() as session:
+            await scan_and_clean_up(args, session, None, report=report)
+    report.close()
+
+    assert "  firefox-l10n-fr: 48\n" in caplog.text
+    assert "  firefox: 24\n" in caplog.text
+    assert "... (38 more)" in caplog.text
+    # Full listings are only logged at the DEBUG level.
+    assert "unique_expired_versions = " not in caplog.text
+    assert "repository = " not in caplog.text
+    assert len(path.read_text().splitlines()) == 24 + 48
@@ -0,0 +1,52 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from mozilla_linux_pkg_manager.session import Session
+
+
+@pytest.mark.asyncio
+async def test_session_reuses_clients():
+    clients = [AsyncMock(), AsyncMock()]
+
+    with patch.object(Session, "create_client", side_effect=clients) as create_client:
+        async with Session(channels=2) as session:
+            handed_out = [session.client() for _ in range(4)]
+
+    assert create_client.call_count == 2
+    assert handed_out == clients * 2
+    for client in clients:
+        client.transport.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_session_without_api_calls_opens_nothing():
+    with patch.object(Session, "create_client") as create_client:
+        async with Session(channels=4):
+            pass
+
+    create_client.assert_not_called()
+
+
+def test_session_default_client():
+    mock_client = MagicMock()
+    with patch(
+        "mozilla_linux_pkg_manager.session.artifactregistry_v1.ArtifactRegistryAsyncClient",
+        return_value=mock_client,
+    ):
+        assert Session().client() is mock_client
+
+
+@pytest.mark.parametrize(
+    "channels,keepalive_seconds,expected",
+    [
+        (1, 0, {}),
+        (2, 0, {"grpc.use_local_subchannel_pool": 1}),
+        (1, 30, {"grpc.keepalive_time_ms": 30000}),
+    ],
+)
+def test_session_channel_options(channels, keepalive_seconds, expected):
+    options = dict(Session(channels, keepalive_seconds).channel_options())
+    assert expected.items() <= options.items()
+    if not expected:
+        assert options == {}
@@ -0,0 +1,102 @@
+import dataclasses
+import json
+import sys
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from conftest import clean_up_args
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import (
+    CleanUpSummary,
+    in_shard,
+    main,
+    scan_and_clean_up,
+    shard_args,
+)
+
+PREFIX = "projects/fake-project/locations/us/repositories/mozilla/packages"
+
+
+def test_shard_args():
+    args = clean_up_args("--package", ".*", "--shard-index", "1", "--shard-count", "3")
+    args.processes = 2
+    packages = [f"{PREFIX}/firefox-l10n-{i}" for i in range(100)]
+
+    shards = shard_args(args)
+    assert [(shard.shard_index, shard.shard_count) for shard in shards] == [
+        (1, 6),
+        (4, 6),
+    ]
+    # The processes cover the packages of the worker's shard, exactly once.
+    covered = [
+        [package for package in packages if in_shard(package, shard)]
+        for shard in shards
+    ]
+    assert sorted(covered[0] + covered[1]) == sorted(
+        package for package in packages if in_shard(package, args)
+    )
+    assert not set(covered[0]) & set(covered[1])
+
+
+@pytest.mark.asyncio
+async def test_sharded_clean_up(monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry.synthetic(
+        4800, packages=16, interval=timedelta(hours=1)
+    )
+
+    summaries = []
+    async with registry.session() as session:
+        for shard_index in range(3):
+            args = clean_up_args(
+                "--package",
+                ".*",
+                "--shard-index",
+                str(shard_index),
+                "--shard-count",
+                "3",
+            )
+            summaries.append(await scan_and_clean_up(args, session, cache=None))
+
+    assert all(summary.version_count for summary in summaries)
+    summary = CleanUpSummary.merge(summaries)
+    assert summary.version_count == 4800
+    assert summary.expired_packages == 16
+    assert summary.expired_count == 16 * (300 - 24)
+    assert summary.deleted_versions == registry.deleted_versions == 16 * (300 - 24)
+    assert summary.unique_expired_versions == sorted(
+        f"1.0.{i}" for i in range(300 - 24)
+    )
+    assert summary.failed_batches == []
+
+
+def test_merge_summaries(tmp_path, caplog):
+    paths = []
+    for index, failed_batches in enumerate(([], [[f"{PREFIX}/a", ["v"], "error"]])):
+        summary = CleanUpSummary(
+            package=".*",
+            version_count=10,
+            expired_packages=1,
+            expired_count=4,
+            unique_expired_versions=["1.0", f"2.{index}"],
+            succeeded_batches=1,
+            failed_batches=failed_batches,
+            deleted_versions=4,
+        )
+        paths.append(tmp_path / f"summary-{index}.json")
+        paths[-1].write_text(json.dumps(dataclasses.asdict(summary)))
+
+    argv = ["mozilla-linux-pkg-manager", "merge-summaries", *map(str, paths)]
+    with (
+        patch.object(sys, "argv", argv),
+        pytest.raises(SystemExit) as exc_info,
+        caplog.at_level("INFO"),
+    ):
+        main()
+
+    assert exc_info.value.code == 1
+    assert "There's a total of 8 expired versions to clean-up!" in caplog.text
+    assert "there are 3 unique versions across all packages" in caplog.text
+    assert "2 batches succeeded and 1 failed" in caplog.text
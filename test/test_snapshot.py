@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import sys
+from datetime import timedelta
+
+import pytest
+from fake import FakeArtifactRegistry
+
+from mozilla_linux_pkg_manager.cli import get_parser, write_snapshot
+from mozilla_linux_pkg_manager.metrics import Histogram
+from mozilla_linux_pkg_manager.report import AGE_BUCKETS
+from mozilla_linux_pkg_manager.snapshot import Snapshot, SnapshotWriter
+
+NOW = 1722470400
+DAY = 86400
+REPOSITORY = "projects/fake-project/locations/us/repositories/mozilla"
+
+
+def write(path, packages):
+    with SnapshotWriter(str(path)) as writer:
+        for name, versions in packages.items():
+            writer.add_package(f"{REPOSITORY}/packages/{name}", versions)
+    return Snapshot(str(path))
+
+
+def test_snapshot_rows(tmp_path):
+    snapshot = write(
+        tmp_path / "inventory.snp",
+        {
+            "firefox": [("1.0.1", NOW - DAY), ("1.0.0", NOW - 2 * DAY)],
+            "firefox-l10n-fr": [("1.0.0", NOW - 2 * DAY)],
+            "thunderbird": [],
+        },
+    )
+
+    assert len(snapshot) == 3
+    # Versions are sorted by creation time and their names interned.
+    assert list(snapshot.rows()) == [
+        (REPOSITORY, "firefox", "1.0.0", NOW - 2 * DAY),
+        (REPOSITORY, "firefox", "1.0.1", NOW - DAY),
+        (REPOSITORY, "firefox-l10n-fr", "1.0.0", NOW - 2 * DAY),
+    ]
+    assert snapshot.versions == ["1.0.0", "1.0.1"]
+    assert snapshot.counts() == {
+        f"{REPOSITORY}/packages/firefox": 2,
+        f"{REPOSITORY}/packages/firefox-l10n-fr": 1,
+        f"{REPOSITORY}/packages/thunderbird": 0,
+    }
+
+
+def test_snapshot_age_histograms(tmp_path):
+    create_times = [NOW - index * 3 * DAY for index in range(400)]
+    snapshot = write(
+        tmp_path / "inventory.snp",
+        {"firefox": [(f"1.0.{index}", t) for index, t in enumerate(create_times)]},
+    )
+    histogram = Histogram(AGE_BUCKETS)
+    for create_time in create_times:
+        histogram.observe((NOW - create_time) / DAY)
+
+    assert snapshot.age_histograms(NOW) == {
+        f"{REPOSITORY}/packages/firefox": histogram.counts
+    }
+
+
+def test_snapshot_byteorder(tmp_path):
+    path = tmp_path / "inventory.snp"
+    write(path, {"firefox": [("1.0.0", NOW)]})
+    snapshot = Snapshot(str(path))
+    snapshot.swap = True
+    other = "little" if sys.byteorder == "big" else "big"
+
+    _, create_times = snapshot.read_columns(0)
+
+    assert create_times[0] == int.from_bytes(NOW.to_bytes(8, sys.byteorder), other)
+
+
+def test_snapshot_writer_error(tmp_path):
+    path = tmp_path / "inventory.snp"
+    with pytest.raises(RuntimeError), SnapshotWriter(str(path)) as writer:
+        writer.add_package(f"{REPOSITORY}/packages/firefox", [("1.0.0", NOW)])
+        raise RuntimeError("The run was interrupted")
+
+    # No partial snapshot is left behind.
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_write_snapshot_error(tmp_path, monkeypatch):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    # There's no mozilla repository in europe.
+    registry = FakeArtifactRegistry(
+        {"mozilla": {f"firefox-l10n-{index}": 1 for index in range(20)}},
+        page_latency=0.05,
+    )
+    path = tmp_path / "inventory.snp"
+    args = get_parser().parse_args(
+        ["inventory", "--package", "^firefox", "--repository", "mozilla"]
+        + ["--region", "us", "europe", "--output", str(path)]
+    )
+
+    with pytest.raises(ExceptionGroup), SnapshotWriter(str(path)) as writer:
+        async with registry.session() as session:
+            await write_snapshot(args, session, writer)
+    listed = registry.calls.get("list_versions", 0)
+
+    # The other repository was cancelled rather than left writing.
+    await asyncio.sleep(0.5)
+    assert registry.calls.get("list_versions", 0) == listed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_snapshot_invalid(tmp_path):
+    path = tmp_path / "plan.jsonl"
+    path.write_text("{}\n")
+    with pytest.raises(ValueError, match="isn't a snapshot file"):
+        Snapshot(str(path))
+
+
+@pytest.mark.asyncio
+async def test_write_snapshot(tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "fake-project")
+    registry = FakeArtifactRegistry(
+        {
+            "mozilla": {"firefox": 2500, "firefox-l10n-fr": 48, "thunderbird": 10},
+            "europe/mozilla": {"firefox": 24},
+        },
+        interval=timedelta(hours=1),
+    )
+    path = tmp_path / "inventory.snp"
+    args = get_parser().parse_args(
+        [
+            "inventory",
+            "--package",
+            "^firefox",
+            "--repository",
+            "mozilla",
+            "--region",
+            "us",
+            "europe",
+            "--scan-concurrency",
+            "2",
+            "--output",
+            str(path),
+        ]
+    )
+
+    with SnapshotWriter(str(path)) as writer:
+        async with registry.session() as session:
+            counts = await write_snapshot(args, session, writer)
+
+    assert sorted(counts) == [24, 48, 2500]
+    snapshot = Snapshot(str(path))
+    assert len(snapshot) == 2500 + 48 + 24
+    assert len(snapshot.versions) == 2500
+    now = registry.newest.timestamp()
+    with caplog.at_level(logging.INFO):
+        snapshot.log(now=now, top=1)
+    assert "has 2572 versions of 3 packages" in caplog.text
+    assert "  firefox: 2500\n" in caplog.text
+    assert f"  0-7 days: {7 * 24 + 48 + 24}\n" in caplog.text